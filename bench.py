@@ -0,0 +1,327 @@
+"""Load and latency benchmark for the chatbot.
+
+Starts local mocks of OpenRouter's /api/v1/chat/completions (JSON and SSE
+streaming, with a configurable token rate and error rate) and of the
+DuckDuckGo search API, points app.py at them, then drives concurrent
+sessions through Streamlit's AppTest and reports per-turn percentiles:
+
+    python bench.py --sessions 8 --turns 4 --token-rate 40 --error-rate 0.05
+    python bench.py --serve-only    # just the mocks, for `streamlit run app.py`
+
+Each session runs in its own process because AppTest swaps process-wide
+globals (the runtime and st.secrets) on every run. As a result
+st.cache_resource state, such as the rate limiter and the response cache,
+is per session here, not shared the way it is on a real server.
+"""
+import argparse
+import collections
+import concurrent.futures
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+COMPLETIONS_PATH = "/api/v1/chat/completions"
+
+QUESTIONS = [
+    "What is the air quality index and how is it calculated?",
+    "How do PM2.5 particles affect human health?",
+    "Compare solar and wind power for a small town.",
+    "What does EnviroCast forecast and how accurate is it?",
+    "Explain how ozone forms near the ground on hot days.",
+    "Which cities have improved their air quality the most and why?",
+]
+FILLER = "Particulate levels depend on traffic , weather and industry , so forecasts blend sensor data with models .".split()
+
+# ------------------------
+# Mock upstreams
+# ------------------------
+def turn_tag(session, turn):
+    return f"s{session}t{turn}"
+
+def reply_marker(tag):
+    """First token of the mock reply to a tagged prompt; its first render marks time to first token"""
+    return f"reply-{tag}"
+
+def mock_reply_tokens(messages, count):
+    """A reply that opens with the prompt's tag marker, then filler words"""
+    prompt = next((msg["content"] for msg in reversed(messages) if msg["role"] == "user"), "")
+    tag = re.search(r"\[(s\d+t\d+)\]", prompt)
+    tokens = [reply_marker(tag.group(1)) if tag else "Benchmark"]
+    tokens.extend(" " + FILLER[i % len(FILLER)] for i in range(count - 1))
+    return tokens
+
+class MockHandler(BaseHTTPRequestHandler):
+    """OpenRouter completions, DuckDuckGo search and result pages, all on one port"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload, status=200):
+        self.send_body(json.dumps(payload).encode("utf-8"), "application/json", status)
+
+    def write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        config = self.server.config
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if urllib.parse.urlsplit(self.path).path != COMPLETIONS_PATH:
+            return self.send_json({"error": {"message": "not found"}}, status=404)
+
+        self.server.count("completions")
+        if random.random() < config.error_rate:
+            self.server.count("injected errors")
+            return self.send_json({"error": {"message": "mock upstream error"}}, status=config.error_status)
+
+        tokens = mock_reply_tokens(request.get("messages", []), config.reply_tokens)
+        usage = {"prompt_tokens": len(json.dumps(request.get("messages", []))) // 4, "completion_tokens": len(tokens)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        time.sleep(config.ttft)
+
+        if not request.get("stream"):
+            time.sleep(len(tokens) / config.token_rate)
+            return self.send_json({
+                "id": f"gen-{uuid.uuid4().hex}",
+                "model": request.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self.write_chunk(b": OPENROUTER PROCESSING\n\n")
+            generation = f"gen-{uuid.uuid4().hex}"
+            for token in tokens:
+                chunk = {"id": generation, "model": request.get("model"), "choices": [{"index": 0, "delta": {"content": token}}]}
+                self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                time.sleep(1 / config.token_rate)
+            self.write_chunk(f"data: {json.dumps({'id': generation, 'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Hedged or cancelled requests hang up mid-stream
+            self.server.count("cancelled streams")
+            self.close_connection = True
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        base = f"http://{self.headers.get('Host')}"
+
+        if url.path == "/search":
+            self.server.count("searches")
+            query = urllib.parse.parse_qs(url.query).get("q", [""])[0]
+            limit = int(urllib.parse.parse_qs(url.query).get("maxresults", ["5"])[0])
+            time.sleep(self.server.config.search_latency)
+            return self.send_json({"results": [
+                {"title": f"{query} ({n})", "link": f"{base}/page/{uuid.uuid5(uuid.NAMESPACE_URL, query).hex}-{n}", "snippet": " ".join(FILLER)}
+                for n in range(limit)
+            ]})
+
+        if url.path.startswith("/page/"):
+            self.server.count("pages")
+            paragraphs = "".join(f"<p>{' '.join(FILLER)}</p>" for _ in range(20))
+            html = f"<html><head><title>{url.path}</title></head><body><nav>Menu</nav><article>{paragraphs}</article></body></html>"
+            return self.send_body(html.encode("utf-8"), "text/html; charset=utf-8")
+
+        self.send_json({"error": {"message": "not found"}}, status=404)
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, MockHandler)
+        self.config = config
+        self.counts = collections.Counter()
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+def start_mock_server(config):
+    """Serve the mocks on a daemon thread and point app.py's endpoints at them"""
+    server = MockServer(("127.0.0.1", config.port), config)
+    threading.Thread(target=server.serve_forever, name="enviro-bench-mock", daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    os.environ["ENVIRO_OPENROUTER_URL"] = base + COMPLETIONS_PATH
+    os.environ["ENVIRO_SEARCH_URL"] = base + "/search"
+    return server
+
+# ------------------------
+# Simulated sessions
+# ------------------------
+class TurnMeter:
+    """Script runs, bytes sent and first reply-token time observed during one turn"""
+
+    def start(self, marker):
+        self.marker = marker.encode("utf-8")
+        self.started = time.perf_counter()
+        self.reruns = 0
+        self.bytes = 0
+        self.first_token = None
+
+    def on_event(self, sender, event, **kwargs):
+        from streamlit.runtime.scriptrunner import ScriptRunnerEvent
+
+        if event == ScriptRunnerEvent.SCRIPT_STARTED:
+            self.reruns += 1
+        elif event == ScriptRunnerEvent.ENQUEUE_FORWARD_MSG:
+            data = kwargs["forward_msg"].SerializeToString()
+            self.bytes += len(data)
+            if self.first_token is None and self.marker in data:
+                self.first_token = time.perf_counter() - self.started
+
+def install_meter():
+    """Make every AppTest script runner in this process report to one TurnMeter"""
+    from streamlit.testing.v1 import app_test
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+    meter = TurnMeter()
+    meter.start("")
+
+    class MeteredScriptRunner(LocalScriptRunner):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.on_event.connect(meter.on_event, weak=False)
+
+    app_test.LocalScriptRunner = MeteredScriptRunner
+    return meter
+
+def run_session(session, turns, timeout, deep_research):
+    """Drive one AppTest session through its turns; returns one sample per turn"""
+    from streamlit.testing.v1 import AppTest
+
+    meter = install_meter()
+    app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    app.secrets["ENVIRO_API_KEY"] = "bench"
+    app.run()
+    if app.exception:
+        raise Exception(f"app.py failed to load: {app.exception[0].value}")
+    if deep_research:
+        next(box for box in app.checkbox if box.label.startswith("Enable Deep Research")).check().run()
+
+    samples = []
+    for turn in range(turns):
+        tag = turn_tag(session, turn)
+        meter.start(reply_marker(tag))
+        app.chat_input[0].set_value(f"[{tag}] {QUESTIONS[(session + turn) % len(QUESTIONS)]}").run()
+        latency = time.perf_counter() - meter.started
+
+        reply = app.session_state["messages"][-1]["content"] if app.session_state["messages"] else ""
+        error = [str(e.value) for e in app.exception] or ([reply] if meter.first_token is None else [])
+        samples.append({
+            "session": session,
+            "turn": turn,
+            "ttft": meter.first_token,
+            "latency": latency,
+            "reruns": meter.reruns,
+            "bytes": meter.bytes,
+            "error": error[0][:200] if error else None,
+        })
+    return samples
+
+# ------------------------
+# Report
+# ------------------------
+def percentile(values, q):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+def report(samples, counts, elapsed):
+    rows = [
+        ("time to first token (s)", "ttft", "{:.3f}"),
+        ("turn latency (s)", "latency", "{:.3f}"),
+        ("reruns per turn", "reruns", "{:.0f}"),
+        ("bytes sent per turn", "bytes", "{:,.0f}"),
+    ]
+    print(f"\n{'metric':<26}{'p50':>12}{'p95':>12}{'p99':>12}{'n':>6}")
+    for label, key, fmt in rows:
+        values = [sample[key] for sample in samples if sample[key] is not None]
+        if not values:
+            print(f"{label:<26}{'-':>12}{'-':>12}{'-':>12}{0:>6}")
+            continue
+        cells = "".join(f"{fmt.format(percentile(values, q)):>12}" for q in (50, 95, 99))
+        print(f"{label:<26}{cells}{len(values):>6}")
+
+    failed = [sample for sample in samples if sample["error"]]
+    print(f"\n{len(samples)} turns in {elapsed:.1f}s, {len(failed)} failed")
+    print("upstream: " + ", ".join(f"{count} {name}" for name, count in sorted(counts.items())))
+    for sample in failed[:5]:
+        print(f"  session {sample['session']} turn {sample['turn']}: {sample['error']}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per session")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="mock tokens per second per stream")
+    parser.add_argument("--reply-tokens", type=int, default=120, help="tokens per mock reply")
+    parser.add_argument("--ttft", type=float, default=0.3, help="mock upstream delay before the first token (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of completions that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected failures")
+    parser.add_argument("--search-latency", type=float, default=0.2, help="mock search delay (s)")
+    parser.add_argument("--deep-research", action="store_true", help="turn on Deep Research in every session")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-turn AppTest timeout (s)")
+    parser.add_argument("--port", type=int, default=0, help="mock server port (default: any free port)")
+    parser.add_argument("--json", help="also write the raw per-turn samples to this file")
+    parser.add_argument("--serve-only", action="store_true", help="run the mocks until interrupted")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    server = start_mock_server(args)
+
+    if args.serve_only:
+        print(f"export ENVIRO_OPENROUTER_URL={os.environ['ENVIRO_OPENROUTER_URL']}")
+        print(f"export ENVIRO_SEARCH_URL={os.environ['ENVIRO_SEARCH_URL']}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            return
+
+    # A fresh disk cache per run, and a rate limit that measures the app rather than the quota
+    os.environ.setdefault("ENVIRO_CACHE_DIR", tempfile.mkdtemp(prefix="enviro-bench-"))
+    os.environ.setdefault("ENVIRO_RPM", "100000")
+    os.environ.setdefault("ENVIRO_TPM", "100000000")
+
+    started = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=args.sessions,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        futures = [
+            pool.submit(run_session, session, args.turns, args.timeout, args.deep_research)
+            for session in range(args.sessions)
+        ]
+        samples = [sample for future in futures for sample in future.result()]
+    elapsed = time.perf_counter() - started
+
+    report(samples, server.counts, elapsed)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(samples, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""EnviroCast chatbot internals.
+
+Streamlit re-executes app.py on every rerun, but imported modules stay in
+sys.modules. Code and data that live here are loaded once per process
+instead of on every interaction.
+"""
+import functools
+import json
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+CACHE_DIR = os.getenv("ENVIRO_CACHE_DIR") or os.path.join(ROOT_DIR, ".enviro_cache")
+
+
+@functools.lru_cache(maxsize=None)
+def load_text(name):
+    """A packaged data file's text, read once per process"""
+    with open(os.path.join(DATA_DIR, name), encoding="utf-8") as f:
+        return f.read().strip()
+
+
+@functools.lru_cache(maxsize=None)
+def load_json(name):
+    """A packaged JSON data file, parsed once per process; treat it as read-only"""
+    with open(os.path.join(DATA_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
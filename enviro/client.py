@@ -0,0 +1,532 @@
+"""Model API client: HTTP sessions, model routing, retries, rate limiting and request coalescing"""
+import streamlit as st
+import requests
+import requests.adapters
+import httpx
+import json
+import time
+import os
+import hashlib
+import functools
+import collections
+import threading
+import asyncio
+import queue
+import importlib.util
+import random
+import datetime
+import email.utils
+from enviro.metrics import UpstreamTimer, get_metrics
+from enviro.prompt import estimate_tokens
+
+# (connect, read) timeouts in seconds; read applies between streamed chunks
+API_TIMEOUT = (5, 60)
+SEARCH_TIMEOUT = (5, 10)
+HTTP_POOL_SIZE = 32
+
+@st.cache_resource
+def get_http_session():
+    """Process-wide keep-alive session for web search and page fetches"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=HTTP_POOL_SIZE,
+        pool_block=False,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+OPENROUTER_URL = os.getenv("ENVIRO_OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+STREAM_DONE = object()  # end-of-stream marker on token queues
+
+@st.cache_resource
+def get_model_loop():
+    """Shared asyncio loop on a daemon thread; every session's model I/O runs here"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="enviro-model-loop", daemon=True).start()
+    return loop
+
+@st.cache_resource
+def get_async_client():
+    """Process-wide async HTTP client (HTTP/2 when h2 is installed) for the model API"""
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+        timeout=httpx.Timeout(API_TIMEOUT[1], connect=API_TIMEOUT[0]),
+    )
+
+# ------------------------
+# Model routing
+# ------------------------
+# Tried in order; override with a comma-separated ENVIRO_MODELS
+MODEL_ROUTE = [
+    model.strip()
+    for model in os.getenv(
+        "ENVIRO_MODELS",
+        "meta-llama/llama-3.3-70b-instruct:free,"
+        "meta-llama/llama-4-maverick:free,"
+        "mistralai/mistral-small-3.2-24b-instruct:free",
+    ).split(",")
+    if model.strip()
+]
+MAX_ATTEMPTS_PER_MODEL = 2
+RETRY_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+FATAL_STATUSES = {401, 402, 403}  # account problems fail the same way on every model
+BACKOFF_BASE = 0.5                # seconds
+BACKOFF_CAP = 8.0
+MAX_RETRY_AFTER = 10.0            # longer Retry-After waits move on to the next model instead
+HEDGE_AFTER = 6.0                 # seconds without a first token before hedging on the next model
+
+class UpstreamError(Exception):
+    """Failed model request, with what the router needs to decide on a retry"""
+    
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+    
+    @property
+    def retryable(self):
+        return self.status is None or self.status in RETRY_STATUSES
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((email.utils.parsedate_to_datetime(value) - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+async def upstream_error(response):
+    body = (await response.aread()).decode("utf-8", "replace")
+    return UpstreamError(
+        f"API request failed: {response.status_code} - {body}",
+        status=response.status_code,
+        retry_after=parse_retry_after(response.headers.get("Retry-After")),
+    )
+
+def get_api_key():
+    """OpenRouter key from Streamlit secrets or the environment"""
+    return st.secrets.get("ENVIRO_API_KEY") or os.getenv("ENVIRO_API_KEY")
+
+def grok_request(messages, stream, model=None):
+    headers = {
+        "Authorization": f"Bearer {get_api_key()}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://chat.envirocast.org/",
+        "X-Title": "EnviroCast AI Chatbot",
+    }
+    
+    data = {
+        "model": model or MODEL_ROUTE[0],
+        "messages": messages,
+        "temperature": 0.1,
+        "max_tokens": 8192,
+        "stream": stream
+    }
+    return headers, data
+
+def attempt_plan():
+    """(model, attempt) pairs in the order the router may try them"""
+    return [(model, attempt) for model in MODEL_ROUTE for attempt in range(MAX_ATTEMPTS_PER_MODEL)]
+
+def skip_model(plan, model):
+    return [(m, attempt) for m, attempt in plan if m != model]
+
+async def stream_attempt(client, model, attempt, messages, emit, race, metrics, delay=0.0, charge=None):
+    """One streaming attempt; only the first attempt to produce a token may emit"""
+    if delay:
+        await asyncio.sleep(delay)
+    if charge:
+        await charge()
+    
+    headers, data = grok_request(messages, stream=True, model=model)
+    timer = UpstreamTimer(metrics, model)
+    usage = {}
+    decode = 0.0
+    try:
+        async with client.stream("POST", OPENROUTER_URL, headers=headers, json=data, extensions={"trace": timer.trace}) as response:
+            metrics.upstream_responses.labels(model, str(response.status_code)).inc()
+            if response.is_error:
+                raise await upstream_error(response)
+            
+            async for line in response.aiter_lines():
+                started = time.perf_counter()
+                delta = parse_stream_line(line, usage)
+                decode += time.perf_counter() - started
+                if delta is STREAM_DONE:
+                    break
+                if not delta:
+                    continue
+                if race.get("winner") is None:
+                    race["winner"] = asyncio.current_task()
+                elif race["winner"] is not asyncio.current_task():
+                    return  # a hedged duplicate answered first
+                timer.mark("first_token")
+                emit(delta)
+            timer.mark("last_byte")
+    except httpx.TransportError as e:
+        metrics.upstream_responses.labels(model, "transport_error").inc()
+        raise UpstreamError(f"API request failed: {e!r}") from e
+    
+    metrics.stage_seconds.labels("json_decode").observe(decode)
+    metrics.record_usage(model, usage)
+    
+    if race.get("winner") is None:
+        raise UpstreamError(f"API returned an empty response from {model}")
+
+async def stream_with_fallback(client, messages, emit, metrics, charge=None):
+    """Stream from the first healthy model: retry with backoff, fail over, and hedge slow starts.
+
+    The caller pays the rate limit for the first request; charge() is awaited
+    before every retry and hedge so they draw on the same shared budget.
+    """
+    plan = attempt_plan()
+    started = 0
+    race = {}
+    running = {}  # task -> model
+    hedged = False
+    last_error = None
+    
+    try:
+        while True:
+            if not running:
+                if not plan:
+                    raise last_error or Exception("No models configured")
+                model, attempt = plan.pop(0)
+                delay = backoff_delay(attempt, last_error.retry_after) if attempt and last_error else 0.0
+                attempt_charge = charge if started else None
+                started += 1
+                running[asyncio.ensure_future(stream_attempt(client, model, attempt, messages, emit, race, metrics, delay, attempt_charge))] = model
+            
+            # Hedge once: a duplicate request to the next model if no token arrives in time
+            hedge_model = next((m for m, _ in plan if m not in running.values()), None)
+            can_hedge = not hedged and race.get("winner") is None and hedge_model is not None
+            done, _ = await asyncio.wait(
+                running,
+                timeout=HEDGE_AFTER if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            
+            if not done:
+                hedged = True
+                plan = skip_model(plan, hedge_model)
+                running[asyncio.ensure_future(stream_attempt(client, hedge_model, 0, messages, emit, race, metrics, charge=charge))] = hedge_model
+                continue
+            
+            for task in done:
+                model = running.pop(task)
+                error = task.exception()
+                if race.get("winner") is task:
+                    if error:
+                        # Tokens were already shown; a silent retry would duplicate them
+                        raise error
+                    return
+                if error is None:
+                    continue
+                
+                last_error = error
+                if isinstance(error, UpstreamError):
+                    if error.status in FATAL_STATUSES:
+                        raise error
+                    if not error.retryable or (error.retry_after or 0) > MAX_RETRY_AFTER:
+                        plan = skip_model(plan, model)
+                else:
+                    raise error
+    finally:
+        for task in running:
+            task.cancel()
+
+async def stream_chat(client, messages, tokens, metrics, charge=None):
+    """Stream completion deltas into a thread-safe queue for the script thread"""
+    try:
+        await stream_with_fallback(client, messages, tokens.put, metrics, charge)
+    except Exception as e:
+        tokens.put(e)
+    else:
+        tokens.put(STREAM_DONE)
+
+def iter_token_queue(tokens, future):
+    """Yield deltas from the queue; stopping early cancels the request on the loop.
+
+    Like every delta stream here, a timeout in seconds can be passed with
+    send(); "" is yielded if no delta arrives within it.
+    """
+    timeout = None
+    try:
+        while True:
+            try:
+                item = tokens.get(timeout=timeout)
+            except queue.Empty:
+                timeout = yield ""
+                continue
+            if item is STREAM_DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            timeout = yield item
+    finally:
+        future.cancel()
+
+def call_grok_api(messages, charge=None):
+    """Stream a Grok reply via OpenRouter on the shared event loop as an iterator of content deltas.
+
+    charge is an async callable awaited before each retry or hedge request.
+    """
+    loop = get_model_loop()
+    client = get_async_client()
+    metrics = get_metrics()
+    
+    tokens = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(stream_chat(client, messages, tokens, metrics, charge), loop)
+    return iter_token_queue(tokens, future)
+
+def parse_stream_line(line, usage=None):
+    """Content delta from one OpenRouter SSE line, STREAM_DONE at the end, else None.
+
+    Token usage, sent in the final chunk, is copied into the usage dict if given.
+    """
+    # Skip keep-alive blanks and SSE comments (": OPENROUTER PROCESSING")
+    if not line or not line.startswith("data:"):
+        return None
+    
+    payload = line[len("data:"):].strip()
+    if payload == "[DONE]":
+        return STREAM_DONE
+    
+    try:
+        chunk = json.loads(payload)
+    except ValueError:
+        return None
+    
+    if "error" in chunk:
+        # OpenRouter has already answered 200, so provider 429s and 5xxs arrive
+        # here; carry the status so the router can retry or fall back
+        error = chunk["error"] if isinstance(chunk["error"], dict) else {"message": chunk["error"]}
+        try:
+            status = int(error.get("code"))
+        except (TypeError, ValueError):
+            status = None
+        raise UpstreamError(f"API stream failed: {error.get('message', error)}", status=status)
+    
+    if usage is not None and chunk.get("usage"):
+        usage.update(chunk["usage"])
+    
+    choices = chunk.get("choices") or []
+    if not choices:
+        return None
+    return choices[0].get("delta", {}).get("content")
+
+# ------------------------
+# Rate limiting
+# ------------------------
+REQUESTS_PER_MINUTE = float(os.getenv("ENVIRO_RPM", "20"))
+TOKENS_PER_MINUTE = float(os.getenv("ENVIRO_TPM", "200000"))
+EXPECTED_COMPLETION_TOKENS = 1000  # charged up front; the real size is unknown until the reply ends
+QUEUE_POLL_SECONDS = 0.5
+
+class TokenBucket:
+    """Refills continuously at capacity per minute"""
+    
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+    
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+    
+    def wait_time(self, amount):
+        self.refill()
+        amount = min(amount, self.capacity)
+        return max(amount - self.level, 0) * 60 / self.capacity
+    
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+class RateLimiter:
+    """Process-wide requests- and tokens-per-minute limiter with a FIFO wait queue"""
+    
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.condition = threading.Condition()
+        self.queue = collections.deque()
+    
+    def try_take(self, ticket, tokens):
+        """(position, seconds to wait), or None once the budget was taken; call with the condition held"""
+        position = self.queue.index(ticket) + 1
+        # Strict FIFO: only the head of the queue may take budget
+        if position > 1:
+            return position, QUEUE_POLL_SECONDS
+        wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+        if wait > 0:
+            return position, wait
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        return None
+    
+    def leave(self, ticket):
+        with self.condition:
+            self.queue.remove(ticket)
+            self.condition.notify_all()
+    
+    def acquire(self, tokens, on_wait=None):
+        """Block until this request's turn and budget come up; on_wait(position, seconds) reports progress"""
+        ticket = object()
+        with self.condition:
+            self.queue.append(ticket)
+        try:
+            while True:
+                with self.condition:
+                    waiting = self.try_take(ticket, tokens)
+                if waiting is None:
+                    return
+                if on_wait:
+                    on_wait(*waiting)
+                with self.condition:
+                    self.condition.wait(timeout=min(waiting[1], QUEUE_POLL_SECONDS))
+        finally:
+            self.leave(ticket)
+    
+    async def acquire_async(self, tokens):
+        """acquire() for retries and hedges on the model loop, waiting without blocking it"""
+        ticket = object()
+        with self.condition:
+            self.queue.append(ticket)
+        try:
+            while True:
+                with self.condition:
+                    waiting = self.try_take(ticket, tokens)
+                if waiting is None:
+                    return
+                await asyncio.sleep(min(waiting[1], QUEUE_POLL_SECONDS))
+        finally:
+            self.leave(ticket)
+
+class SharedStream:
+    """Deltas of one upstream completion, replayable by every session that asked the same thing"""
+    
+    def __init__(self):
+        self.deltas = []
+        self.finished = False
+        self.error = None
+        self.condition = threading.Condition()
+    
+    def publish(self, delta):
+        with self.condition:
+            self.deltas.append(delta)
+            self.condition.notify_all()
+    
+    def close(self, error=None):
+        with self.condition:
+            self.finished = True
+            self.error = error
+            self.condition.notify_all()
+    
+    def follow(self):
+        position = 0
+        timeout = None
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: position < len(self.deltas) or self.finished, timeout)
+                pending = self.deltas[position:]
+                position = len(self.deltas)
+                finished, error = self.finished, self.error
+            if not pending and not finished:
+                timeout = yield ""  # timed out waiting on the leader
+                continue
+            for delta in pending:
+                timeout = yield delta
+            if finished and position == len(self.deltas):
+                if error:
+                    raise error
+                return
+
+class RequestCoalescer:
+    """Tracks in-flight completions so identical concurrent requests share one upstream call"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight = {}
+    
+    def join(self, key):
+        """(stream, is_leader) for this request key"""
+        with self.lock:
+            if key in self.inflight:
+                return self.inflight[key], False
+            stream = self.inflight[key] = SharedStream()
+            return stream, True
+    
+    def release(self, key):
+        with self.lock:
+            self.inflight.pop(key, None)
+
+@st.cache_resource
+def get_rate_limiter():
+    return RateLimiter()
+
+@st.cache_resource
+def get_request_coalescer():
+    return RequestCoalescer()
+
+def lead_stream(key, stream, deltas):
+    """Relay the upstream deltas to this session and to any coalesced followers"""
+    error = None
+    timeout = None
+    try:
+        while True:
+            try:
+                delta = deltas.send(timeout)
+            except StopIteration:
+                break
+            if delta:
+                stream.publish(delta)
+            timeout = yield delta
+    except Exception as e:
+        error = e
+        raise
+    except BaseException:
+        # This session was interrupted (e.g. a rerun); followers must not hang
+        error = Exception("The shared request was interrupted, please try again")
+        raise
+    finally:
+        get_request_coalescer().release(key)
+        stream.close(error)
+
+def request_completion(messages, on_wait=None):
+    """Rate-limited, coalesced streaming completion; yields content deltas"""
+    key = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+    coalescer = get_request_coalescer()
+    stream, is_leader = coalescer.join(key)
+    if not is_leader:
+        return stream.follow()
+    
+    try:
+        tokens = sum(estimate_tokens(msg["content"]) for msg in messages) + EXPECTED_COMPLETION_TOKENS
+        limiter = get_rate_limiter()
+        with get_metrics().timed("queue_wait"):
+            limiter.acquire(tokens, on_wait)
+        # Retries and hedges are separate upstream requests and pay the same way
+        deltas = call_grok_api(messages, functools.partial(limiter.acquire_async, tokens))
+    except BaseException as e:
+        coalescer.release(key)
+        stream.close(e if isinstance(e, Exception) else Exception("The shared request was interrupted, please try again"))
+        raise
+    return lead_stream(key, stream, deltas)
@@ -0,0 +1,510 @@
+"""Document uploads: parsing, OCR, tabular analytics and the upload cache"""
+import streamlit as st
+import json
+import time
+import os
+import io
+import re
+import math
+import hashlib
+import itertools
+import concurrent.futures
+import multiprocessing
+import contextlib
+import sqlite3
+import zlib
+from enviro import CACHE_DIR
+from enviro.prompt import KnowledgeIndex
+
+# ------------------------
+# Document ingestion
+# ------------------------
+CHUNK_CHARS = 1500
+CHUNK_OVERLAP = 200
+MAX_CHUNKS_PER_FILE = 4000
+SHEET_ROWS_PER_SEGMENT = 50
+ATTACHMENT_TOP_K = 5
+IMAGE_TYPES = ["png", "jpg", "jpeg", "tif", "tiff", "bmp", "webp"]
+UPLOAD_TYPES = ["pdf", "docx", "xlsx", "xlsm", "csv", "xml", "txt", "md", "json"] + IMAGE_TYPES
+OCR_WORKERS = os.cpu_count() or 1
+OCR_MAX_IN_FLIGHT = 2 * OCR_WORKERS
+OCR_DPI = 200
+UPLOAD_CACHE_BYTES = 512 * 1024 * 1024  # compressed chunk storage across all sessions
+
+@st.cache_resource
+def get_ocr_executor():
+    """Process pool sized to the host, shared by all sessions for OCR"""
+    # spawn: forking the multithreaded Streamlit server is not safe
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=OCR_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+def iter_ocr_pages(pages, total, progress=None):
+    """OCR (label, png bytes) pages in the process pool, yielding text as each page finishes"""
+    from enviro import ocr
+    
+    executor = get_ocr_executor()
+    pages = iter(pages)
+    pending = {}
+    finished = 0
+    while True:
+        # Keep a bounded window of rasterized pages in flight
+        while len(pending) < OCR_MAX_IN_FLIGHT:
+            page = next(pages, None)
+            if page is None:
+                break
+            label, image = page
+            pending[executor.submit(ocr.ocr_image, image)] = label
+        if not pending:
+            return
+        
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            label = pending.pop(future)
+            finished += 1
+            if progress:
+                progress(finished, total, label)
+            yield f"{label} (OCR)", future.result()
+
+def iter_pdf_pages(file, progress=None):
+    """Yield (label, text) per PDF page without materializing the whole document's text"""
+    try:
+        import fitz
+    except ImportError:
+        import PyPDF2
+        reader = PyPDF2.PdfReader(file)
+        for number, page in enumerate(reader.pages, 1):
+            yield f"page {number}", page.extract_text() or ""
+        return
+    
+    with fitz.open(stream=file, filetype="pdf") as document:
+        scanned = []
+        for number, page in enumerate(document, 1):
+            text = page.get_text()
+            if text.strip() or not page.get_images():
+                yield f"page {number}", text
+            else:
+                scanned.append(number)
+        
+        # Image-only pages are rasterized lazily as the OCR window frees up
+        if scanned:
+            rasters = (
+                (f"page {number}", document[number - 1].get_pixmap(dpi=OCR_DPI).tobytes("png"))
+                for number in scanned
+            )
+            yield from iter_ocr_pages(rasters, len(scanned), progress)
+
+def iter_image_pages(file, progress=None):
+    """Yield OCR text for an image upload, one page per frame of multi-page TIFFs"""
+    from PIL import Image, ImageSequence
+    
+    with Image.open(file) as image:
+        frame_count = getattr(image, "n_frames", 1)
+        
+        def frames():
+            for number, frame in enumerate(ImageSequence.Iterator(image), 1):
+                buffer = io.BytesIO()
+                frame.convert("RGB").save(buffer, format="PNG")
+                yield f"image page {number}", buffer.getvalue()
+        
+        yield from iter_ocr_pages(frames(), frame_count, progress)
+
+def iter_docx_blocks(file):
+    """Yield paragraphs, then tables row by row"""
+    import docx
+    
+    document = docx.Document(file)
+    for number, paragraph in enumerate(document.paragraphs, 1):
+        if paragraph.text.strip():
+            yield f"paragraph {number}", paragraph.text
+    for table_number, table in enumerate(document.tables, 1):
+        for row in table.rows:
+            yield f"table {table_number}", " | ".join(cell.text.strip() for cell in row.cells)
+
+def iter_sheet_rows(file):
+    """Yield batches of worksheet rows, one sheet at a time, in openpyxl read-only mode"""
+    import openpyxl
+    
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            batch = []
+            for row in sheet.iter_rows(values_only=True):
+                if any(value is not None for value in row):
+                    batch.append(", ".join("" if value is None else str(value) for value in row))
+                if len(batch) >= SHEET_ROWS_PER_SEGMENT:
+                    yield f"sheet {sheet.title}", "\n".join(batch)
+                    batch = []
+            if batch:
+                yield f"sheet {sheet.title}", "\n".join(batch)
+    finally:
+        workbook.close()
+
+def iter_text_lines(file, rows_per_segment=SHEET_ROWS_PER_SEGMENT):
+    """Yield batches of lines from a text or CSV upload, decoding incrementally"""
+    reader = io.TextIOWrapper(file, encoding="utf-8", errors="replace", newline="")
+    try:
+        batch = []
+        start = 1
+        for number, line in enumerate(reader, 1):
+            batch.append(line.rstrip("\r\n"))
+            if len(batch) >= rows_per_segment:
+                yield f"lines {start}-{number}", "\n".join(batch)
+                batch = []
+                start = number + 1
+        if batch:
+            yield f"lines {start}-{start + len(batch) - 1}", "\n".join(batch)
+    finally:
+        # Leave the upload open for Streamlit; only drop the wrapper
+        reader.detach()
+
+def iter_xml_elements(file):
+    """Yield leaf element text with its tag path, clearing parsed elements as it goes"""
+    import lxml.etree
+    
+    batch = []
+    for _, element in lxml.etree.iterparse(file, events=("end",), recover=True, huge_tree=True):
+        if len(element) == 0 and element.text and element.text.strip():
+            batch.append(f"{element.tag}: {element.text.strip()}")
+        element.clear(keep_tail=True)
+        if len(batch) >= SHEET_ROWS_PER_SEGMENT:
+            yield "elements", "\n".join(batch)
+            batch = []
+    if batch:
+        yield "elements", "\n".join(batch)
+
+DOCUMENT_PARSERS = {
+    "pdf": iter_pdf_pages,
+    "docx": iter_docx_blocks,
+    "xlsx": iter_sheet_rows,
+    "xlsm": iter_sheet_rows,
+    "xml": iter_xml_elements,
+}
+DOCUMENT_PARSERS.update({extension: iter_image_pages for extension in IMAGE_TYPES})
+
+# Parsers that may run OCR and report per-page progress
+OCR_PARSERS = (iter_pdf_pages, iter_image_pages)
+
+def iter_document_segments(file, name, progress=None):
+    extension = os.path.splitext(name)[1].lower().lstrip(".")
+    parser = DOCUMENT_PARSERS.get(extension, iter_text_lines)
+    file.seek(0)
+    if parser in OCR_PARSERS:
+        return parser(file, progress)
+    return parser(file)
+
+def chunk_segments(name, segments, size=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Pack parsed segments into overlapping chunks labelled with where they came from"""
+    buffer = ""
+    first_label = None
+    for label, text in segments:
+        text = " ".join(text.split())
+        if not text:
+            continue
+        first_label = first_label or label
+        buffer = f"{buffer} {text}".strip()
+        while len(buffer) >= size:
+            yield f"[{name}, {first_label}]\n{buffer[:size]}"
+            buffer = buffer[size - overlap:]
+            first_label = label
+    if buffer:
+        yield f"[{name}, {first_label}]\n{buffer}"
+
+# ------------------------
+# Tabular analytics
+# ------------------------
+TABLE_TYPES = ["csv", "xlsx", "xlsm"]
+CSV_CHUNK_ROWS = 100_000
+CATEGORY_MAX_RATIO = 0.5     # object columns with fewer unique values than this share become categoricals
+TABLE_SUMMARY_CHARS = 6000
+MAX_STATION_ROWS = 15
+
+# (column name pattern, label, threshold in ppb/µg/m³/AQI, averaging hours,
+#  threshold in ppm, median below which a column is taken to be in ppm)
+# The ppm cutoffs sit between typical ambient medians in the two units: CO is
+# hundreds of ppb but around 0.2-3 ppm, the other gases tens of ppb but hundredths of a ppm.
+POLLUTANT_STANDARDS = [
+    (r"pm_?2[._]?5", "PM2.5 24-h NAAQS (µg/m³)", 35, 24, None, None),
+    (r"pm_?10", "PM10 24-h NAAQS (µg/m³)", 150, 24, None, None),
+    (r"(?<![a-z0-9])o3(?![a-z0-9])|ozone", "O3 8-h NAAQS", 70, 8, 0.070, 1),
+    (r"(?<![a-z0-9])no2(?![a-z0-9])", "NO2 1-h NAAQS", 100, 1, 0.100, 0.5),
+    (r"(?<![a-z0-9])so2(?![a-z0-9])", "SO2 1-h NAAQS", 75, 1, 0.075, 0.2),
+    (r"(?<![a-z0-9])co(?![a-z0-9])", "CO 8-h NAAQS", 9000, 8, 9, 50),
+    (r"(?<![a-z0-9])aqi(?![a-z0-9])", "AQI Unhealthy for Sensitive Groups", 100, None, None, None),
+]
+STATION_COLUMN_PATTERN = r"station|site|monitor|location|sensor"
+TIME_COLUMN_PATTERN = r"date|time|timestamp|datetime"
+
+def downcast_frame(frame):
+    """Shrink dtypes column by column: numeric downcast, low-cardinality text to category"""
+    import pandas as pd
+    
+    for column in frame.columns:
+        series = frame[column]
+        if pd.api.types.is_integer_dtype(series):
+            frame[column] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series):
+            frame[column] = pd.to_numeric(series, downcast="float")
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            numeric = pd.to_numeric(series, errors="coerce")
+            if numeric.notna().sum() >= 0.9 * series.notna().sum() and numeric.notna().any():
+                frame[column] = pd.to_numeric(numeric, downcast="float")
+            elif re.search(TIME_COLUMN_PATTERN, str(column), re.IGNORECASE):
+                frame[column] = pd.to_datetime(series, errors="coerce")
+            elif series.nunique(dropna=True) <= CATEGORY_MAX_RATIO * len(series):
+                frame[column] = series.astype("category")
+    return frame
+
+def load_table_frames(file, name):
+    """Yield (label, typed frame) per CSV file or worksheet"""
+    import pandas as pd
+    
+    extension = os.path.splitext(name)[1].lower().lstrip(".")
+    file.seek(0)
+    if extension == "csv":
+        # Read in row chunks and downcast each before concatenating to cap peak memory
+        chunks = [downcast_frame(chunk) for chunk in pd.read_csv(file, chunksize=CSV_CHUNK_ROWS, low_memory=False)]
+        if chunks:
+            yield name, downcast_frame(pd.concat(chunks, ignore_index=True))
+        return
+    
+    for sheet, frame in pd.read_excel(file, sheet_name=None, engine="openpyxl").items():
+        if not frame.empty:
+            yield f"{name} [{sheet}]", downcast_frame(frame)
+
+def find_column(frame, pattern, predicate):
+    for column in frame.columns:
+        if re.search(pattern, str(column), re.IGNORECASE) and predicate(frame[column]):
+            return column
+    return None
+
+def pollutant_thresholds(frame):
+    """(column, label, threshold, averaging hours) for numeric columns that look like regulated pollutants"""
+    thresholds = []
+    for column in frame.select_dtypes("number").columns:
+        for pattern, label, threshold, hours, ppm_threshold, ppm_below in POLLUTANT_STANDARDS:
+            if re.search(pattern, str(column), re.IGNORECASE):
+                if ppm_threshold is not None and frame[column].median() < ppm_below:
+                    threshold = ppm_threshold
+                thresholds.append((column, label, threshold, hours))
+                break
+    return thresholds
+
+WINDOW_COMPLETENESS = 0.75  # share of a window's expected samples needed before its mean counts
+
+def window_min_periods(ordered, hours):
+    """Samples a trailing window of this many hours needs to count as a full average"""
+    import pandas as pd
+    
+    if isinstance(ordered.index, pd.DatetimeIndex):
+        interval = ordered.index.unique().to_series().diff().median()
+        expected = hours / (interval / pd.Timedelta(hours=1)) if interval and interval > pd.Timedelta(0) else hours
+    else:
+        expected = hours  # consecutive samples stand in for hours
+    return max(1, math.ceil(WINDOW_COMPLETENESS * expected))
+
+def rolling_mean(ordered, columns, hours, station_column):
+    """Trailing rolling means over complete windows, within each station when there is a station column"""
+    import pandas as pd
+    
+    window = f"{hours}h" if isinstance(ordered.index, pd.DatetimeIndex) else hours
+    min_periods = window_min_periods(ordered, hours)
+    if station_column is not None:
+        return ordered.groupby(station_column, observed=True)[columns].rolling(window, min_periods=min_periods).mean()
+    return ordered[columns].rolling(window, min_periods=min_periods).mean()
+
+def summarize_table(label, frame):
+    """Compact numeric summary of one table: stats, exceedances, rolling means, per-station aggregates"""
+    import pandas as pd
+    
+    lines = [f"TABLE SUMMARY: {label}: {len(frame):,} rows x {len(frame.columns)} columns"]
+    
+    time_column = find_column(frame, TIME_COLUMN_PATTERN, pd.api.types.is_datetime64_any_dtype)
+    station_column = find_column(frame, STATION_COLUMN_PATTERN, lambda series: not pd.api.types.is_numeric_dtype(series))
+    numeric = frame.select_dtypes("number")
+    
+    if time_column is not None:
+        lines.append(f"Time range ({time_column}): {frame[time_column].min()} to {frame[time_column].max()}")
+    if station_column is not None:
+        lines.append(f"Stations ({station_column}): {frame[station_column].nunique()}")
+    
+    if not numeric.empty:
+        stats = numeric.describe(percentiles=[0.5, 0.95]).T
+        lines.append("Statistics (count, mean, std, min, p50, p95, max):")
+        for column, row in stats.iterrows():
+            values = ", ".join(f"{row[key]:.4g}" for key in ["mean", "std", "min", "50%", "95%", "max"])
+            lines.append(f"- {column}: {int(row['count']):,}, {values}")
+    
+    ordered = None
+    if time_column is not None:
+        ordered = frame.dropna(subset=[time_column]).sort_values(time_column).set_index(time_column)
+    
+    thresholds = pollutant_thresholds(frame)
+    if thresholds:
+        lines.append("Exceedances (values above standard):")
+        for column, standard, threshold, hours in thresholds:
+            # Multi-hour standards apply to means over their averaging period, not single readings
+            if hours and hours > 1 and ordered is not None:
+                values = rolling_mean(ordered, [column], hours, station_column)[column]
+                basis = f"trailing {hours}-hour means"
+            else:
+                values = frame[column]
+                basis = "samples"
+            over = int((values > threshold).sum())
+            share = over / max(values.notna().sum(), 1)
+            lines.append(f"- {column} > {threshold:g} ({standard}): {over:,} {basis} ({share:.1%})")
+    
+    pollutant_columns = [column for column, _, _, _ in thresholds] or list(numeric.columns[:5])
+    if pollutant_columns and len(frame) > 1:
+        # 24-hour windows when timestamps exist, otherwise 24 consecutive samples
+        if ordered is not None:
+            rolled = rolling_mean(ordered, pollutant_columns, 24, station_column)
+            window_label = "24-hour"
+        else:
+            rolled = rolling_mean(frame, pollutant_columns, 24, station_column)
+            window_label = "24-sample"
+        lines.append(f"Highest {window_label} rolling mean (windows at least {WINDOW_COMPLETENESS:.0%} complete):")
+        for column in pollutant_columns:
+            highest = rolled[column].max()
+            lines.append(f"- {column}: {highest:.4g}" if pd.notna(highest) else f"- {column}: no complete window")
+    
+    if station_column is not None and pollutant_columns:
+        column = pollutant_columns[0]
+        per_station = frame.groupby(station_column, observed=True)[column].agg(["mean", "max", "count"])
+        per_station = per_station.sort_values("mean", ascending=False).head(MAX_STATION_ROWS)
+        lines.append(f"Per-station {column} (mean, max, count), highest mean first:")
+        for station, row in per_station.iterrows():
+            lines.append(f"- {station}: {row['mean']:.4g}, {row['max']:.4g}, {int(row['count']):,}")
+    
+    return "\n".join(lines)[:TABLE_SUMMARY_CHARS]
+
+def analyze_table(file, name):
+    """Summary chunks for a spreadsheet upload, one per CSV or worksheet"""
+    return [summarize_table(label, frame) for label, frame in load_table_frames(file, name)]
+
+class UploadStore:
+    """Size-bounded LRU disk cache of parsed uploads keyed by SHA-256 of the file bytes"""
+    
+    def __init__(self, path, max_bytes=UPLOAD_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        with self.connect() as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS uploads (digest TEXT PRIMARY KEY, name TEXT, content BLOB, size INTEGER, accessed REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS uploads_accessed ON uploads (accessed)")
+    
+    def connect(self):
+        return contextlib.closing(sqlite3.connect(self.path, timeout=10))
+    
+    def get(self, digest):
+        """(name, chunks) parsed from identical bytes earlier, or None"""
+        with self.connect() as conn, conn:
+            row = conn.execute("SELECT name, content FROM uploads WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE uploads SET accessed = ? WHERE digest = ?", (time.time(), digest))
+        return row[0], json.loads(zlib.decompress(row[1]))
+    
+    def put(self, digest, name, chunks):
+        content = zlib.compress(json.dumps(chunks).encode("utf-8"), 6)
+        with self.connect() as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO uploads (digest, name, content, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                (digest, name, content, len(content), time.time()),
+            )
+            # Evict least recently used uploads until the cache fits its budget
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM uploads").fetchone()[0]
+            for old_digest, size in conn.execute("SELECT digest, size FROM uploads ORDER BY accessed").fetchall():
+                if total <= self.max_bytes or old_digest == digest:
+                    break
+                conn.execute("DELETE FROM uploads WHERE digest = ?", (old_digest,))
+                total -= size
+
+@st.cache_resource
+def get_upload_store():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return UploadStore(os.path.join(CACHE_DIR, "uploads.sqlite3"))
+
+def file_digest(file):
+    """SHA-256 of an upload, read in blocks"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(1024 * 1024), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+def ingest_document(file, name, progress=None, analyze_tables=False):
+    """Parse an upload into bounded chunks plus a BM25 index for per-question retrieval"""
+    store = get_upload_store()
+    digest = file_digest(file)
+    extension = os.path.splitext(name)[1].lower().lstrip(".")
+    if analyze_tables and extension in TABLE_TYPES:
+        # Data mode: only the numeric summary is kept, never the raw rows
+        digest += ":analytics"
+    
+    cached = store.get(digest)
+    if cached is not None:
+        # Same bytes seen before (any session): skip parsing and OCR entirely
+        cached_name, chunks = cached
+        if cached_name != name:
+            chunks = [chunk.replace(cached_name, name, 1) for chunk in chunks]
+    elif digest.endswith(":analytics"):
+        chunks = analyze_table(file, name)
+        store.put(digest, name, chunks)
+    else:
+        segments = iter_document_segments(file, name, progress)
+        chunks = list(itertools.islice(chunk_segments(name, segments), MAX_CHUNKS_PER_FILE))
+        store.put(digest, name, chunks)
+    
+    # The BM25 index is rebuilt from the cached chunks; that is a single cheap pass
+    return {"name": name, "digest": digest, "chunks": chunks, "index": KnowledgeIndex(chunks)}
+
+def sync_attachments(uploaded_files, analyze_tables=False):
+    """Parse newly uploaded files and forget ones the user removed.
+
+    A file that fails to parse is remembered as {"error": ...} so later reruns
+    don't parse it again while it is still in the uploader.
+    """
+    attachments = st.session_state.attachments
+    current = {}
+    for uploaded in uploaded_files:
+        file_id = getattr(uploaded, "file_id", None) or f"{uploaded.name}:{uploaded.size}"
+        file_id = f"{file_id}:{'analytics' if analyze_tables else 'text'}"
+        if file_id not in attachments:
+            with st.status(f"Reading {uploaded.name}...") as status:
+                def progress(finished, total, label, status=status, name=uploaded.name):
+                    # Scanned pages report in as the OCR workers finish them
+                    status.update(label=f"Reading {name}: recognized {finished}/{total} scanned pages")
+                    status.write(f"✓ {label}")
+                
+                try:
+                    attachments[file_id] = ingest_document(uploaded, uploaded.name, progress, analyze_tables)
+                except Exception as e:
+                    status.update(label=f"⚠️ Could not read {uploaded.name}: {str(e)}", state="error")
+                    attachments[file_id] = {"error": str(e)}
+                else:
+                    status.update(label=f"Read {uploaded.name}", state="complete", expanded=False)
+        elif "error" in attachments[file_id]:
+            st.caption(f"⚠️ Could not read {uploaded.name}: {attachments[file_id]['error']}")
+        current[file_id] = attachments[file_id]
+    st.session_state.attachments = current
+
+def retrieve_attachments(messages):
+    """Excerpts from attached documents relevant to the latest question, or an empty string"""
+    if not st.session_state.attachments:
+        return ""
+    
+    question = " ".join([msg["content"] for msg in messages if msg["role"] == "user"][-2:])
+    excerpts = []
+    for attachment in st.session_state.attachments.values():
+        if "error" in attachment:
+            continue
+        # Generic questions ("summarize this") still get the document's opening
+        hits = attachment["index"].search(question, k=ATTACHMENT_TOP_K) or attachment["chunks"][:2]
+        excerpts.extend(hits)
+    if not excerpts:
+        return ""
+    
+    return "ATTACHED DOCUMENT EXCERPTS (uploaded by the user; answer from these when asked about their files):\n\n" + "\n\n".join(excerpts)
@@ -0,0 +1,239 @@
+"""Self-hosted web fonts: Google Fonts families vendored into static/fonts"""
+import streamlit as st
+import json
+import time
+import os
+import re
+import hashlib
+import functools
+import threading
+import concurrent.futures
+import unicodedata
+from enviro import ROOT_DIR
+from enviro.client import get_http_session
+
+# ------------------------
+# Font assets
+# ------------------------
+FONT_DIR = os.path.join(ROOT_DIR, "static", "fonts")
+FONT_URL_PREFIX = "app/static/fonts/"
+FONT_WEIGHTS = "300;400;500;600;700"
+FONT_TIMEOUT = (5, 30)
+FONT_RETRY_SECONDS = 10 * 60       # before retrying a family whose download failed
+FONT_WORKERS = 2
+FONT_POLL_SECONDS = 1.0            # how often a page waiting on its font checks whether it is ready
+GOOGLE_FONTS_CSS = "https://fonts.googleapis.com/css2"
+MATERIAL_ICONS_CSS = "https://fonts.googleapis.com/icon?family=Material+Icons"
+# Google only serves WOFF2 (and per-script unicode-range subsets) to modern browsers
+WOFF2_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+FONT_FACE_PATTERN = re.compile(r"(?:/\*\s*(?P<label>[^*]+?)\s*\*/\s*)?@font-face\s*\{(?P<body>[^}]*)\}")
+FONT_URL_PATTERN = re.compile(r"url\((?P<url>[^)]+)\)")
+
+# Unicode script names (first word of unicodedata.name) to Google Fonts subsets
+SCRIPT_SUBSETS = {
+    "CYRILLIC": ["cyrillic", "cyrillic-ext"], "GREEK": ["greek", "greek-ext"], "ARABIC": ["arabic"],
+    "HEBREW": ["hebrew"], "DEVANAGARI": ["devanagari"], "BENGALI": ["bengali"], "GURMUKHI": ["gurmukhi"],
+    "GUJARATI": ["gujarati"], "ORIYA": ["oriya"], "TAMIL": ["tamil"], "TELUGU": ["telugu"], "KANNADA": ["kannada"],
+    "MALAYALAM": ["malayalam"], "SINHALA": ["sinhala"], "THAI": ["thai"], "LAO": ["lao"], "TIBETAN": ["tibetan"],
+    "MYANMAR": ["myanmar"], "GEORGIAN": ["georgian"], "ARMENIAN": ["armenian"], "ETHIOPIC": ["ethiopic"],
+    "KHMER": ["khmer"], "CANADIAN": ["canadian-aboriginal"], "HANGUL": ["korean"],
+    "HIRAGANA": ["japanese"], "KATAKANA": ["japanese"], "CJK": ["chinese-simplified"],
+}
+LANGUAGE_SUBSETS = {  # where the native name alone does not tell the script variant
+    "Vietnamese": ["vietnamese"],
+    "Cantonese": ["chinese-hongkong"],
+    "Japanese": ["japanese"],
+}
+# CJK families are split by Google into numbered unicode-range slices instead of named subsets
+SLICED_SUBSETS = {"chinese-simplified", "chinese-traditional", "chinese-hongkong", "japanese", "korean"}
+
+@functools.lru_cache(maxsize=None)
+def subsets_for_language(language):
+    """Google Fonts subsets needed for the interface plus replies in the given language"""
+    name, _, native = language.partition(" - ")
+    subsets = {"latin"}
+    subsets.update(LANGUAGE_SUBSETS.get(name.split()[-1], []))
+    for char in native:
+        if ord(char) < 0x100 or not char.isalpha():
+            continue  # Latin-1 is part of the latin subset
+        script = unicodedata.name(char, "").split(" ")[0]
+        subsets.update(SCRIPT_SUBSETS.get(script, ["latin-ext"] if script == "LATIN" else []))
+    return tuple(sorted(subsets))
+
+def unquote(url):
+    return url.strip().strip("'\"")
+
+def google_fonts_url(family, weights=FONT_WEIGHTS):
+    query = family.replace(" ", "+") + (f":wght@{weights}" if weights else "")
+    return f"{GOOGLE_FONTS_CSS}?family={query}&display=swap"
+
+class FontAssets:
+    """Downloads stylesheets' WOFF2 files once, rewrites them to local content-addressed copies.
+
+    Font files are named by the hash of their bytes and stylesheets by the
+    hash of their text, so a URL never changes meaning and can be cached
+    indefinitely by browsers and any proxy in front of the app.
+    """
+
+    def __init__(self, directory=FONT_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.lock = threading.Lock()
+        self.pending = {}   # key -> Future
+        self.failed = {}    # key -> time of the failure
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=FONT_WORKERS, thread_name_prefix="enviro-fonts")
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def request(self, key, urls, subsets=None):
+        """The vendored entry for key if ready, else None after queueing it in the background"""
+        with self.lock:
+            entry = self.manifest.get(key)
+            if entry is not None:
+                return entry
+            if key in self.pending or time.time() - self.failed.get(key, 0) < FONT_RETRY_SECONDS:
+                return None
+            self.pending[key] = self.executor.submit(self.vendor, key, urls, subsets, get_http_session())
+        return None
+
+    def is_pending(self, key):
+        with self.lock:
+            return key in self.pending
+    
+    def vendor(self, key, urls, subsets, session):
+        """Download the first stylesheet that exists, keep the wanted subsets and store it locally"""
+        try:
+            css = self.fetch_stylesheet(urls, session)
+            entry = self.localize(css, subsets, session)
+        except Exception:
+            with self.lock:
+                self.failed[key] = time.time()
+                self.pending.pop(key, None)
+            raise
+
+        with self.lock:
+            self.manifest[key] = entry
+            self.pending.pop(key, None)
+            # Written whole and renamed so a crash never leaves a torn manifest
+            temporary = f"{self.manifest_path}.{threading.get_ident()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, indent=1, sort_keys=True)
+            os.replace(temporary, self.manifest_path)
+        return entry
+
+    def fetch_stylesheet(self, urls, session):
+        response = None
+        for url in urls:
+            response = session.get(url, headers={"User-Agent": WOFF2_USER_AGENT}, timeout=FONT_TIMEOUT)
+            # Google answers 400 when a family lacks one of the requested weights
+            if response.ok:
+                return response.text
+        raise Exception(f"Font stylesheet request failed: {response.status_code if response is not None else 'no URL'}")
+
+    def localize(self, css, subsets, session):
+        """Rewrite font URLs to local copies, dropping @font-face blocks for other scripts"""
+        preload = []
+
+        def replace_face(match):
+            label = (match.group("label") or "").strip()
+            sliced = label.startswith("[")
+            if subsets is not None and label and not (label in subsets or sliced and SLICED_SUBSETS & set(subsets)):
+                return ""
+
+            body = FONT_URL_PATTERN.sub(lambda url: f"url({self.download(unquote(url.group('url')), session)})", match.group("body"))
+            # Preload the regular weight of the main scripts; extensions and CJK slices load on demand
+            main_script = subsets is None or label in subsets and not label.endswith("-ext")
+            if main_script and re.search(r"font-weight:\s*400\b", body):
+                preload.append(FONT_URL_PATTERN.search(body).group("url"))
+            return f"@font-face {{{body}}}"
+
+        local_css = FONT_FACE_PATTERN.sub(replace_face, css).strip() + "\n"
+        name = f"{hashlib.sha1(local_css.encode('utf-8')).hexdigest()[:16]}.css"
+        self.write(name, local_css.encode("utf-8"))
+        return {"stylesheet": name, "preload": list(dict.fromkeys(preload))}
+
+    def download(self, url, session):
+        """Local file name of one font file, fetched and stored under its content hash"""
+        response = session.get(url, headers={"User-Agent": WOFF2_USER_AGENT}, timeout=FONT_TIMEOUT)
+        response.raise_for_status()
+        extension = os.path.splitext(url.split("?")[0])[1] or ".woff2"
+        name = f"{hashlib.sha1(response.content).hexdigest()[:16]}{extension}"
+        self.write(name, response.content)
+        return name
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            temporary = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+
+@st.cache_resource
+def get_font_assets():
+    return FontAssets()
+
+def font_key(font_family, language):
+    return f"{font_family}|{','.join(subsets_for_language(language))}"
+
+def font_family_assets(font_family, language):
+    """Vendored entry for a Google Fonts family in the language's scripts, or None while pending"""
+    urls = [google_fonts_url(font_family), google_fonts_url(font_family, weights=None)]
+    return get_font_assets().request(font_key(font_family, language), urls, subsets_for_language(language))
+
+def font_links(font_family, language):
+    """Preload hints and the stylesheet for the selected font, or nothing until it is vendored"""
+    entry = font_family_assets(font_family, language)
+    if entry is None:
+        return ""
+    preload = "".join(
+        f'<link rel="preload" href="{FONT_URL_PREFIX}{name}" as="font" type="font/woff2" crossorigin>'
+        for name in entry["preload"]
+    )
+    return f'{preload}<link rel="stylesheet" href="{FONT_URL_PREFIX}{entry["stylesheet"]}">'
+
+def material_icons_href():
+    """Local Material Icons stylesheet, or Google's until the local copy is ready"""
+    entry = get_font_assets().request("Material Icons", [MATERIAL_ICONS_CSS])
+    return FONT_URL_PREFIX + entry["stylesheet"] if entry else MATERIAL_ICONS_CSS
+
+def font_ready_poll(key):
+    """Rerun the page once the font stops downloading so its links replace the fallback stack"""
+    if not get_font_assets().is_pending(key):
+        st.rerun()
+
+def watch_font(font_family, language):
+    """Poll in a fragment while the selected font is still being vendored"""
+    key = font_key(font_family, language)
+    if get_font_assets().is_pending(key):
+        st.fragment(font_ready_poll, run_every=FONT_POLL_SECONDS)(key)
+
+if __name__ == "__main__":
+    # Vendor families ahead of time, e.g. at deploy:
+    #   python -m enviro.fonts "Inter" "Roboto Slab" --language "Russian - Русский"
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Vendor Google Fonts families into static/fonts")
+    parser.add_argument("families", nargs="*")
+    parser.add_argument("--language", action="append", default=[], help="language option as shown in the sidebar")
+    args = parser.parse_args()
+
+    assets = FontAssets()
+    session = get_http_session()
+    jobs = [("Material Icons", [MATERIAL_ICONS_CSS], None)]
+    for family in args.families:
+        for language in args.language or ["English"]:
+            urls = [google_fonts_url(family), google_fonts_url(family, weights=None)]
+            jobs.append((font_key(family, language), urls, subsets_for_language(language)))
+    for key, urls, subsets in jobs:
+        if key in assets.manifest:
+            continue
+        try:
+            print(key, assets.vendor(key, urls, subsets, session))
+        except Exception as e:
+            print(key, f"failed: {e}")
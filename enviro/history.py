@@ -0,0 +1,85 @@
+"""Persistent conversation history"""
+import streamlit as st
+import time
+import os
+import uuid
+import contextlib
+import sqlite3
+from enviro import CACHE_DIR
+
+# ------------------------
+# Conversation store
+# ------------------------
+CONVERSATION_DB = os.getenv("ENVIRO_CONVERSATION_DB") or os.path.join(CACHE_DIR, "conversations.sqlite3")
+HISTORY_PAGE_SIZE = 30  # messages rendered on load and per "Load earlier messages"
+
+class ConversationStore:
+    """Append-only SQLite log of chat messages, read back newest page first"""
+    
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages (conversation TEXT, seq INTEGER, id TEXT, role TEXT, "
+                "content TEXT, timestamp TEXT, created REAL, PRIMARY KEY (conversation, seq))"
+            )
+    
+    def connect(self):
+        return contextlib.closing(sqlite3.connect(self.path, timeout=10))
+    
+    def append(self, conversation, message):
+        """Store a message at the end of the conversation and return its sequence number"""
+        with self.connect() as conn, conn:
+            # One statement, so two tabs appending to the same conversation can't pick the same seq
+            cursor = conn.execute(
+                "INSERT INTO messages (conversation, seq, id, role, content, timestamp, created) "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ?, ?, ? FROM messages WHERE conversation = ?",
+                (conversation, message["id"], message["role"], message["content"], message["timestamp"], time.time(), conversation),
+            )
+            seq = conn.execute("SELECT seq FROM messages WHERE rowid = ?", (cursor.lastrowid,)).fetchone()[0]
+        return seq
+    
+    def load_page(self, conversation, limit=HISTORY_PAGE_SIZE, before=None):
+        """(messages, has_more) for the newest `limit` messages older than seq `before`"""
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, id, role, content, timestamp FROM messages WHERE conversation = ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (conversation, before if before is not None else 2**62, limit + 1),
+            ).fetchall()
+        messages = [
+            {"id": msg_id, "role": role, "content": content, "timestamp": timestamp, "seq": seq}
+            for seq, msg_id, role, content, timestamp in reversed(rows[:limit])
+        ]
+        return messages, len(rows) > limit
+
+@st.cache_resource
+def get_conversation_store():
+    os.makedirs(os.path.dirname(CONVERSATION_DB), exist_ok=True)
+    return ConversationStore(CONVERSATION_DB)
+
+def load_conversation(conversation_id=None):
+    """Point the session at a stored conversation (a new one if no id) and load its latest page"""
+    conversation_id = conversation_id or uuid.uuid4().hex
+    # The id lives in the URL so a refresh or server restart reopens the thread
+    st.query_params["c"] = conversation_id
+    st.session_state.conversation_id = conversation_id
+    st.session_state.messages, st.session_state.history_has_more = get_conversation_store().load_page(conversation_id)
+    st.session_state.context_digest = {"folded": 0, "lines": []}
+
+def load_earlier_messages():
+    """Prepend the next older page of the conversation to the session"""
+    messages = st.session_state.messages
+    before = messages[0]["seq"] if messages else None
+    earlier, st.session_state.history_has_more = get_conversation_store().load_page(
+        st.session_state.conversation_id, before=before
+    )
+    st.session_state.messages = earlier + messages
+    # The digest counts folded turns from the start of history, which just moved
+    st.session_state.context_digest = {"folded": 0, "lines": []}
+
+def append_message(message):
+    """Persist a message and add it to the session's history"""
+    message["seq"] = get_conversation_store().append(st.session_state.conversation_id, message)
+    st.session_state.messages.append(message)
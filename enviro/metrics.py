@@ -0,0 +1,91 @@
+"""Prometheus metrics for the chat hot path"""
+import streamlit as st
+import time
+import os
+import functools
+import contextlib
+import prometheus_client
+
+# ------------------------
+# Metrics
+# ------------------------
+# Prometheus text format on http://<addr>:<port>/metrics when ENVIRO_METRICS_PORT is set
+METRICS_PORT = int(os.getenv("ENVIRO_METRICS_PORT", "0"))
+METRICS_ADDR = os.getenv("ENVIRO_METRICS_ADDR", "127.0.0.1")
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Metrics:
+    """Process-wide Prometheus collectors for the chat hot path"""
+    
+    def __init__(self, registry):
+        self.registry = registry
+        self.stage_seconds = prometheus_client.Histogram(
+            "enviro_stage_seconds", "Time spent in app-side stages of a chat turn",
+            ["stage"], buckets=LATENCY_BUCKETS, registry=registry,
+        )
+        self.upstream_seconds = prometheus_client.Histogram(
+            "enviro_upstream_seconds", "Model API request phases, from the start of the request",
+            ["model", "phase"], buckets=LATENCY_BUCKETS, registry=registry,
+        )
+        self.upstream_responses = prometheus_client.Counter(
+            "enviro_upstream_responses", "Model API responses by HTTP status",
+            ["model", "status"], registry=registry,
+        )
+        self.upstream_tokens = prometheus_client.Counter(
+            "enviro_upstream_tokens", "Tokens reported in the model API's usage field",
+            ["model", "kind"], registry=registry,
+        )
+    
+    @contextlib.contextmanager
+    def timed(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.labels(stage).observe(time.perf_counter() - started)
+    
+    def record_usage(self, model, usage):
+        for kind in ("prompt", "completion"):
+            if usage.get(f"{kind}_tokens"):
+                self.upstream_tokens.labels(model, kind).inc(usage[f"{kind}_tokens"])
+
+@st.cache_resource
+def get_metrics():
+    registry = prometheus_client.CollectorRegistry()
+    if METRICS_PORT:
+        prometheus_client.start_http_server(METRICS_PORT, addr=METRICS_ADDR, registry=registry)
+    return Metrics(registry)
+
+def timed_stage(stage):
+    """Decorator recording each call's duration under the given stage"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_metrics().timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class UpstreamTimer:
+    """Phase timings of one model API request, fed by httpx's trace extension"""
+    
+    def __init__(self, metrics, model):
+        self.metrics = metrics
+        self.model = model
+        self.started = time.perf_counter()
+        self.connecting = False
+        self.seen = set()
+    
+    def mark(self, phase):
+        if phase not in self.seen:
+            self.seen.add(phase)
+            self.metrics.upstream_seconds.labels(self.model, phase).observe(time.perf_counter() - self.started)
+    
+    async def trace(self, event, info):
+        # Only requests that open a new connection report a connect phase
+        if event == "connection.connect_tcp.started":
+            self.connecting = True
+        elif event.endswith(".send_request_headers.started") and self.connecting:
+            self.mark("connect")
+        elif event.endswith(".receive_response_headers.complete"):
+            self.mark("first_byte")
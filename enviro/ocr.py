@@ -0,0 +1,15 @@
+"""OCR workers for scanned uploads.
+
+Separate from enviro.documents so ProcessPoolExecutor workers only import
+pytesseract and Pillow, not Streamlit and the rest of the app.
+"""
+import io
+
+import pytesseract
+from PIL import Image
+
+
+def ocr_image(image_bytes, lang="eng"):
+    """Recognize the text in one encoded page image"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return pytesseract.image_to_string(image, lang=lang)
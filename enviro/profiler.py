@@ -0,0 +1,163 @@
+"""Opt-in per-session rerun profiler"""
+import streamlit as st
+import time
+import functools
+import collections
+import threading
+import contextlib
+from streamlit.delta_generator import DeltaGenerator
+from streamlit.runtime.scriptrunner import RerunException
+
+# ------------------------
+# Rerun profiler
+# ------------------------
+PROFILE_HISTORY = 20  # reruns kept per session
+PROFILE_SECTIONS = ["sidebar", "styles", "history", "input", "model", "other"]
+
+class RerunProfiler:
+    """Section timings, st.markdown payload sizes and st.rerun() calls of profiled reruns.
+
+    Every session's script runs on its own thread, so the rerun being
+    profiled is tracked per thread and other sessions pass straight through.
+    """
+    
+    def __init__(self):
+        self.local = threading.local()
+        original_markdown = getattr(DeltaGenerator.markdown, "__wrapped__", DeltaGenerator.markdown)
+        original_rerun = getattr(st.rerun, "__wrapped__", st.rerun)
+        
+        @functools.wraps(original_markdown)
+        def markdown(dg, body, *args, **kwargs):
+            run = self.current()
+            if run is not None:
+                text = str(body)
+                run["payloads"].append((run["section"], " ".join(text.split())[:60], len(text.encode("utf-8"))))
+            return original_markdown(dg, body, *args, **kwargs)
+        
+        @functools.wraps(original_rerun)
+        def rerun(*args, **kwargs):
+            run = self.current()
+            if run is not None:
+                run["rerun_called"] = True
+            return original_rerun(*args, **kwargs)
+        
+        DeltaGenerator.markdown = markdown
+        # st.markdown was bound to the main container when streamlit was imported
+        st.markdown = markdown.__get__(st.markdown.__self__)
+        st.rerun = rerun
+    
+    def current(self):
+        return getattr(self.local, "run", None)
+    
+    def begin(self, trigger):
+        self.local.run = {
+            "trigger": trigger,
+            "started": time.perf_counter(),
+            "section": "other",
+            "sections": collections.Counter(),
+            "payloads": [],
+            "rerun_called": False,
+            "panel": None,
+        }
+        return self.local.run
+    
+    def end(self):
+        run = self.local.run
+        self.local.run = None
+        run["total"] = time.perf_counter() - run["started"]
+        run["sections"]["other"] = run["total"] - sum(run["sections"].values())
+        return run
+    
+    @contextlib.contextmanager
+    def section(self, name):
+        run = self.current()
+        previous = run["section"]
+        run["section"] = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            run["sections"][name] += time.perf_counter() - started
+            run["section"] = previous
+
+@st.cache_resource
+def get_profiler():
+    return RerunProfiler()
+
+def profiling():
+    return bool(st.session_state.get("profile_reruns"))
+
+@contextlib.contextmanager
+def profile_section(name):
+    """Attribute the enclosed work to a section of the current rerun's profile"""
+    if not profiling():
+        yield
+        return
+    with get_profiler().section(name):
+        yield
+
+def profiled_run(func):
+    """Run the script body, recording the rerun when the session has profiling on"""
+    if not profiling():
+        return func()
+    
+    profile = st.session_state.setdefault("rerun_profile", {
+        "runs": collections.deque(maxlen=PROFILE_HISTORY),
+        "actions": collections.deque(maxlen=PROFILE_HISTORY),
+        "pending_rerun": False,
+        "action_count": 0,
+    })
+    # A rerun requested by st.rerun() belongs to the user action that caused it
+    if profile["pending_rerun"] and profile["actions"]:
+        trigger = "st.rerun()"
+        profile["actions"][-1]["reruns"] += 1
+    else:
+        trigger = "user"
+        profile["action_count"] += 1
+        profile["actions"].append({"action": profile["action_count"], "reruns": 0})
+    profile["pending_rerun"] = False
+    
+    profiler = get_profiler()
+    run = profiler.begin(trigger)
+    run["action"] = profile["actions"][-1]["action"]
+    try:
+        func()
+    except RerunException:
+        profile["pending_rerun"] = run["rerun_called"]
+        raise
+    finally:
+        profile["runs"].append(profiler.end())
+    
+    if run["panel"] is not None:
+        render_profile_panel(profile, run["panel"])
+
+def attach_profile_panel():
+    """Reserve the sidebar spot where this rerun's profile is drawn once it finishes"""
+    run = get_profiler().current() if profiling() else None
+    if run is not None:
+        run["panel"] = st.container()
+
+def render_profile_panel(profile, panel):
+    import pandas as pd
+    
+    latest = profile["runs"][-1]
+    with panel:
+        st.dataframe(pd.DataFrame([
+            {
+                "action": run["action"],
+                "trigger": run["trigger"],
+                "total ms": round(run["total"] * 1000, 1),
+                **{f"{name} ms": round(run["sections"][name] * 1000, 1) for name in PROFILE_SECTIONS},
+                "markdown KB": round(sum(size for _, _, size in run["payloads"]) / 1024, 1),
+            }
+            for run in reversed(profile["runs"])
+        ]), hide_index=True)
+        
+        st.caption(f"st.markdown payloads in the latest rerun ({len(latest['payloads'])})")
+        st.dataframe(
+            pd.DataFrame(latest["payloads"], columns=["section", "payload", "bytes"]).sort_values("bytes", ascending=False),
+            hide_index=True,
+        )
+        
+        st.caption("st.rerun() calls per user action")
+        st.dataframe(pd.DataFrame(reversed(profile["actions"])), hide_index=True)
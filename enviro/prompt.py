@@ -0,0 +1,310 @@
+"""System prompt, conversation context, knowledge retrieval and the response cache"""
+import streamlit as st
+import time
+import re
+import functools
+import collections
+import math
+import threading
+import unicodedata
+from enviro import load_text
+from enviro.metrics import timed_stage
+
+# --------------------------------
+# Configuration
+# --------------------------------
+# Core behaviour prompt, always sent unchanged as the first message
+SYSTEM_INSTRUCTION = load_text("system_instruction.md")
+
+# EnviroCast site knowledge, retrieved per question (see retrieve_knowledge)
+ENVIROCAST_KNOWLEDGE = load_text("knowledge.md")
+
+# ------------------------
+# Preference instruction
+# ------------------------
+@timed_stage("system_instruction")
+def build_dynamic_system_instruction():
+    """Build the preference instruction for the current session's settings"""
+    return build_preference_instruction(
+        st.session_state.response_length,
+        st.session_state.reading_level,
+        st.session_state.citation_style,
+        st.session_state.technical_level,
+        st.session_state.language,
+    )
+
+@functools.lru_cache(maxsize=256)
+def build_preference_instruction(response_length, reading_level, citation_style, technical_level, language):
+    """Small per-user instruction sent after the history.
+
+    SYSTEM_INSTRUCTION itself is always sent unchanged as the first message so
+    that it forms a byte-identical prefix providers can reuse from their prompt cache.
+    """
+    return f"""USER PREFERENCES TO FOLLOW:
+- Response Length: {response_length} (Brief = 1-2 paragraphs, Standard = 2-4 paragraphs, Detailed = 4+ paragraphs with comprehensive explanations)
+- Reading Level: {reading_level} (Elementary = simple words and short sentences, Middle = moderate vocabulary, High School = standard complexity, College = advanced vocabulary and complex concepts)
+- Citation Style: {citation_style} (format all citations accordingly)
+- Technical Detail Level: {technical_level} (Basic = minimal jargon and simple explanations, Intermediate = moderate technical terms with explanations, Advanced = full technical depth and terminology)
+- Language: {language} (respond in this language)
+
+Adjust your responses to match these preferences while maintaining accuracy and helpfulness."""
+
+# ------------------------
+# Conversation context
+# ------------------------
+CONTEXT_TOKEN_BUDGET = 12000  # history tokens sent per turn, excluding the system prompt
+DIGEST_TOKEN_BUDGET = 800     # cap on the rolling summary of turns that no longer fit
+DIGEST_LINE_CHARS = 240
+ERROR_PREFIX = "⚠️ **Error:**"
+
+def estimate_tokens(text):
+    """Local token estimate: ~4 characters per token for Llama-style BPE vocabularies"""
+    return len(text) // 4 + 1
+
+def summarize_turn(message):
+    """One digest line for a turn: role plus its leading sentence, truncated"""
+    text = re.sub(r"<[^>]+>", " ", message["content"])
+    text = " ".join(text.split())
+    first_sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    if len(first_sentence) > DIGEST_LINE_CHARS:
+        first_sentence = first_sentence[:DIGEST_LINE_CHARS].rstrip() + "..."
+    role = "User" if message["role"] == "user" else "Enviro"
+    return f"- {role}: {first_sentence}"
+
+def update_context_digest(dropped):
+    """Fold turns that fell out of the budget into the session's rolling digest"""
+    digest = st.session_state.context_digest
+    
+    # History is append-only, so only turns past the last fold are new
+    if digest["folded"] > len(dropped):
+        digest["folded"] = 0
+        digest["lines"] = []
+    for message in dropped[digest["folded"]:]:
+        digest["lines"].append(summarize_turn(message))
+    digest["folded"] = len(dropped)
+    
+    # Oldest digest lines go first once the digest itself is over budget
+    while digest["lines"] and estimate_tokens("\n".join(digest["lines"])) > DIGEST_TOKEN_BUDGET:
+        digest["lines"].pop(0)
+    
+    return "\n".join(digest["lines"])
+
+def build_context_messages(messages, budget=CONTEXT_TOKEN_BUDGET):
+    """Fit the conversation into the token budget, newest turns first"""
+    # Earlier failures are UI feedback, not conversation the model should see
+    history = [msg for msg in messages if not msg["content"].startswith(ERROR_PREFIX)]
+    
+    kept = []
+    used = 0
+    for msg in reversed(history):
+        cost = estimate_tokens(msg["content"]) + 4  # per-message role/formatting overhead
+        if kept and used + cost > budget:
+            break
+        kept.append(msg)
+        used += cost
+    kept.reverse()
+    
+    context_messages = []
+    digest = update_context_digest(history[:len(history) - len(kept)])
+    if digest:
+        context_messages.append({
+            "role": "system",
+            "content": f"Summary of earlier turns in this conversation (older messages omitted):\n{digest}"
+        })
+    
+    for msg in kept:
+        context_messages.append({
+            "role": msg["role"],
+            "content": msg["content"]
+        })
+    
+    return context_messages
+
+# ------------------------
+# Knowledge retrieval
+# ------------------------
+KNOWLEDGE_TOP_K = 4
+BM25_K1 = 1.5
+BM25_B = 0.75
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i in is it its me of on or
+our that the their this to was what when where which who why will with you your
+""".split())
+
+def tokenize(text):
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+def chunk_knowledge(text):
+    """Split the knowledge base into paragraph chunks labelled with their page/section"""
+    chunks = []
+    page = section = ""
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if not block:
+            continue
+        
+        first_line = block.splitlines()[0]
+        if re.match(r"^[A-Z][A-Z .]+ \(.*\):$", first_line):
+            page, section = first_line.rstrip(":"), ""
+        if re.match(r"^--- .+ ---$", first_line):
+            section = first_line.strip("- ")
+            block = block[len(first_line):].strip()
+            if not block:
+                continue
+        
+        label = " > ".join(part for part in (page, section) if part)
+        if not label or block.startswith(page + ":"):
+            chunks.append(block)
+        else:
+            chunks.append(f"[{label}]\n{block}")
+    return chunks
+
+class KnowledgeIndex:
+    """In-process BM25 index over knowledge chunks"""
+    
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.doc_terms = [collections.Counter(tokenize(chunk)) for chunk in chunks]
+        self.doc_lengths = [sum(terms.values()) for terms in self.doc_terms]
+        self.avg_length = sum(self.doc_lengths) / max(len(chunks), 1)
+        
+        document_frequency = collections.Counter()
+        for terms in self.doc_terms:
+            document_frequency.update(terms.keys())
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+    
+    def search(self, query, k=KNOWLEDGE_TOP_K):
+        query_terms = set(tokenize(query)) & self.idf.keys()
+        if not query_terms:
+            return []
+        
+        scores = []
+        for i, terms in enumerate(self.doc_terms):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[i] / self.avg_length)
+            score = 0.0
+            for term in query_terms:
+                tf = terms.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+            if score > 0:
+                scores.append((score, i))
+        
+        # Return the best chunks in knowledge-base order so sections read naturally
+        best = sorted(scores, reverse=True)[:k]
+        return [self.chunks[i] for _, i in sorted(best, key=lambda item: item[1])]
+
+@st.cache_resource
+def get_knowledge_index():
+    """Built once per process and shared by every session"""
+    return KnowledgeIndex(chunk_knowledge(ENVIROCAST_KNOWLEDGE))
+
+def retrieve_knowledge(messages):
+    """Reference sections relevant to the latest question, or "" if none match"""
+    # Include the previous user turn so short follow-ups keep their topic
+    user_turns = [msg["content"] for msg in messages if msg["role"] == "user"][-2:]
+    sections = get_knowledge_index().search(" ".join(user_turns))
+    if not sections:
+        return ""
+    return "ENVIROCAST REFERENCE SECTIONS (most relevant to this question):\n\n" + "\n\n".join(sections)
+
+# ------------------------
+# Response cache
+# ------------------------
+RESPONSE_CACHE_SIZE = 512
+RESPONSE_CACHE_TTL = 6 * 60 * 60  # seconds
+# Words a rephrasing may add or drop without changing the question. Unlike the
+# retrieval STOPWORDS this leaves out negations, question words and connectives.
+FILLER_WORDS = frozenset("""
+a an the please pls hey hi hello just so can could would you tell me is are
+""".split())
+
+def normalize_prompt(prompt):
+    """Casefolded words in order, without punctuation or filler words"""
+    prompt = prompt.casefold()
+    # Letters, combining marks and digits in any script are kept, so "Cuándo" and
+    # "是什么" stay whole; a dot is kept only between digits, as in "PM2.5"
+    text = "".join(
+        char if unicodedata.category(char)[0] in "LMN"
+        or char == "." and prompt[i - 1:i].isdigit() and prompt[i + 1:i + 2].isdigit()
+        else " "
+        for i, char in enumerate(prompt)
+    )
+    words = text.split()
+    return " ".join(word for word in words if word not in FILLER_WORDS) or " ".join(words)
+
+class ResponseCache:
+    """Process-wide answer cache keyed by the normalized prompt.
+
+    Rephrasings that only differ in case, punctuation or filler words share an
+    entry; any changed content word ("California" vs "Oregon") is a miss.
+    """
+    
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()  # (preferences, prompt) -> (expires, text)
+        self.lock = threading.Lock()
+    
+    def get(self, prompt, preferences):
+        normalized = normalize_prompt(prompt)
+        if not normalized:
+            return None
+        
+        with self.lock:
+            key = (preferences, normalized)
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+    
+    def put(self, prompt, preferences, text):
+        normalized = normalize_prompt(prompt)
+        if not normalized:
+            return
+        
+        with self.lock:
+            key = (preferences, normalized)
+            self.entries[key] = (time.time() + self.ttl, text)
+            self.entries.move_to_end(key)
+            
+            # Expired entries go first, then least recently used
+            now = time.time()
+            for expired_key in [k for k, entry in self.entries.items() if entry[0] <= now]:
+                del self.entries[expired_key]
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
+
+def response_cache_preferences():
+    """Settings that change the answer, used as part of the cache key"""
+    return (
+        st.session_state.response_length,
+        st.session_state.reading_level,
+        st.session_state.citation_style,
+        st.session_state.technical_level,
+        st.session_state.language,
+        st.session_state.get("deep_research", False),
+    )
+
+def cacheable_prompt(messages):
+    """The question if it stands alone (first turn), else None"""
+    # Earlier turns may still be on disk rather than in this page of history
+    if st.session_state.history_has_more:
+        return None
+    user_turns = [msg for msg in messages if msg["role"] == "user"]
+    if len(user_turns) != 1 or messages[-1] is not user_turns[0]:
+        return None
+    return user_turns[0]["content"]
+
+def update_chat_model():
+    """Update the chat model with new system instruction when preferences change"""
+    # For Grok, we don't need to recreate a model, just clear the messages
+    st.session_state.chat_messages = []
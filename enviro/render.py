@@ -0,0 +1,128 @@
+"""Chat message rendering and live streaming"""
+import streamlit as st
+import time
+import uuid
+from enviro.metrics import get_metrics, timed_stage
+
+# -------------------------------------------
+# Chat Functions
+# -------------------------------------------
+def new_message(role, content, timestamp=""):
+    """Create a chat history entry with a stable id for the conversation store"""
+    return {
+        "id": uuid.uuid4().hex,
+        "role": role,
+        "content": content,
+        "timestamp": timestamp
+    }
+
+def message_html(role, content, avatar_icon, timestamp=None):
+    avatar_class = "user-avatar" if role == "user" else "assistant-avatar"
+    message_class = "user-message" if role == "user" else "assistant-message"
+    
+    timestamp_html = ""
+    if st.session_state.show_timestamps and timestamp:
+        timestamp_html = f'<div class="message-timestamp">{timestamp}</div>'
+    
+    return f"""
+    <div class="message {message_class}">
+        <div class="avatar {avatar_class}">{avatar_icon}</div>
+        <div class="message-content">{content}{timestamp_html}</div>
+    </div>
+    """
+
+@timed_stage("display_message")
+def display_history_message(message):
+    avatar_icon = "👤" if message["role"] == "user" else "🌐"
+    st.markdown(message_html(message["role"], message["content"], avatar_icon, message.get("timestamp", "")), unsafe_allow_html=True)
+
+def display_history(messages):
+    """Display the whole transcript; every full rerun sends it to the browser again"""
+    for message in messages:
+        display_history_message(message)
+
+# Seconds between repaints of a streaming reply. Text held back by a frame
+# is painted when the frame is due even if the model stalls, and frames
+# never sleep, so the reply finishes when generation does.
+ANIMATION_FRAME_INTERVALS = {"Off": 0.5, "Slow": 0.25, "Normal": 0.1, "Fast": 0.05}
+
+def frozen_prefix_length(text, start):
+    """End of the last complete paragraph after start that is safe to render on its own"""
+    cut = text.rfind("\n\n", start)
+    # Never split inside a fenced code block
+    while cut > start and text.count("```", 0, cut) % 2:
+        cut = text.rfind("\n\n", start, cut)
+    return cut if cut > start else start
+
+def stream_response_live(deltas, placeholder):
+    """Render model output into the placeholder as tokens arrive from the API.
+
+    Repaints happen at most once per frame interval, and no later than the end
+    of the frame in which text arrived: deltas is read with send(timeout) and
+    yields "" when the frame is due before the next token. Completed paragraphs are
+    sent once as their own element, and only the paragraph still being written
+    is repainted. A long single paragraph or fenced code block is never split,
+    so it is repainted whole on every frame until it ends.
+    """
+    frame_interval = ANIMATION_FRAME_INTERVALS[st.session_state.animation_speed]
+    cursor = "" if st.session_state.animation_speed == "Off" else '<span class="typing-cursor">|</span>'
+    
+    response_text = ""
+    painted = 0
+    frozen = 0
+    bubble = None
+    tail = None
+    last_frame = 0.0
+    paint = 0.0  # time spent sending frames, not waiting on the model
+    timeout = None
+    
+    while True:
+        try:
+            delta = deltas.send(timeout)
+        except StopIteration:
+            break
+        response_text += delta
+        
+        now = time.monotonic()
+        if now - last_frame < frame_interval:
+            # Wait for more text only until this frame is due
+            timeout = frame_interval - (now - last_frame)
+            continue
+        timeout = None
+        if len(response_text) == painted:
+            continue
+        last_frame = now
+        painted = len(response_text)
+        
+        if bubble is None:
+            # First frame replaces the "Enviro is analyzing..." message in place
+            bubble = placeholder.container(key="streaming-reply")
+            tail = bubble.empty()
+        
+        cut = frozen_prefix_length(response_text, frozen)
+        if cut > frozen:
+            tail.markdown(response_text[frozen:cut], unsafe_allow_html=True)
+            tail = bubble.empty()
+            frozen = cut
+        tail.markdown(response_text[frozen:] + cursor, unsafe_allow_html=True)
+        paint += time.monotonic() - now
+    
+    if not response_text:
+        raise Exception("API returned an empty response")
+    
+    # Final render as a single message bubble
+    now = time.monotonic()
+    placeholder.markdown(f"""
+        <div class="message assistant-message">
+            <div class="avatar assistant-avatar">🌐</div>
+            <div class="message-content">{response_text}</div>
+        </div>
+    """, unsafe_allow_html=True)
+    get_metrics().stage_seconds.labels("stream_render").observe(paint + time.monotonic() - now)
+    
+    return response_text
+
+def current_timestamp():
+    if st.session_state.show_timestamps:
+        return time.strftime("%H:%M:%S", time.localtime())
+    return ""
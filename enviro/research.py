@@ -0,0 +1,241 @@
+"""Web search, page fetching and Deep Research"""
+import streamlit as st
+import json
+import time
+import os
+import re
+import concurrent.futures
+import contextlib
+import sqlite3
+import zlib
+from enviro import CACHE_DIR
+from enviro.client import SEARCH_TIMEOUT, get_http_session
+
+# ------------------------
+# Search & page store
+# ------------------------
+SEARCH_CACHE_TTL = 6 * 60 * 60   # seconds
+PAGE_CACHE_TTL = 24 * 60 * 60
+PAGE_MAX_BYTES = 2 * 1024 * 1024
+PAGE_TEXT_CHARS = 20000
+PAGE_EXCERPT_CHARS = 1200
+PAGE_FETCH_WORKERS = 8
+PAGE_FETCH_TIMEOUT = 10          # seconds for the whole fetch stage
+PAGE_FETCH_LIMIT = 6
+
+class SearchStore:
+    """SQLite-backed cache of search results and compressed page text, shared across sessions"""
+    
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS searches (query TEXT PRIMARY KEY, results TEXT, fetched REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, content BLOB, fetched REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS searches_fetched ON searches (fetched)")
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_fetched ON pages (fetched)")
+    
+    def connect(self):
+        # Short-lived connections keep this safe to use from worker threads
+        return contextlib.closing(sqlite3.connect(self.path, timeout=10))
+    
+    def _get(self, sql, key, ttl):
+        with self.connect() as conn:
+            row = conn.execute(sql, (key, time.time() - ttl)).fetchone()
+        return row[0] if row else None
+    
+    def _put(self, sql, key, value, table, ttl):
+        now = time.time()
+        with self.connect() as conn, conn:
+            conn.execute(sql, (key, value, now))
+            # Expired rows are never served again, so drop them instead of letting the file grow
+            conn.execute(f"DELETE FROM {table} WHERE fetched <= ?", (now - ttl,))
+    
+    def get_search(self, query):
+        results = self._get("SELECT results FROM searches WHERE query = ? AND fetched > ?", normalize_query(query), SEARCH_CACHE_TTL)
+        return json.loads(results) if results is not None else None
+    
+    def put_search(self, query, results):
+        self._put("INSERT OR REPLACE INTO searches (query, results, fetched) VALUES (?, ?, ?)", normalize_query(query), json.dumps(results), "searches", SEARCH_CACHE_TTL)
+    
+    def get_page(self, url):
+        content = self._get("SELECT content FROM pages WHERE url = ? AND fetched > ?", url, PAGE_CACHE_TTL)
+        return zlib.decompress(content).decode("utf-8") if content is not None else None
+    
+    def put_page(self, url, text):
+        self._put("INSERT OR REPLACE INTO pages (url, content, fetched) VALUES (?, ?, ?)", url, zlib.compress(text.encode("utf-8"), 6), "pages", PAGE_CACHE_TTL)
+
+@st.cache_resource
+def get_search_store():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return SearchStore(os.path.join(CACHE_DIR, "search.sqlite3"))
+
+@st.cache_resource
+def get_fetch_executor():
+    """Bounded pool for page downloads, separate from searches so neither starves the other"""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS, thread_name_prefix="enviro-fetch")
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+def extract_main_text(html):
+    """Main readable text of an HTML page: article/main if present, else its paragraphs"""
+    import lxml.html
+    
+    document = lxml.html.fromstring(html)
+    for element in document.xpath("//script|//style|//noscript|//nav|//header|//footer|//aside|//form"):
+        element.drop_tree()
+    
+    containers = document.xpath("//article") or document.xpath("//main")
+    if containers:
+        text = " ".join(container.text_content() for container in containers)
+    else:
+        paragraphs = [p.text_content().strip() for p in document.xpath("//p")]
+        text = " ".join(p for p in paragraphs if len(p) > 40)
+    return " ".join(text.split())[:PAGE_TEXT_CHARS]
+
+def fetch_page_text(url, session, store):
+    """Cleaned page text from the store, or downloaded and stored on a miss"""
+    text = store.get_page(url)
+    if text is not None:
+        return text
+    
+    with session.get(url, timeout=SEARCH_TIMEOUT, stream=True) as response:
+        if not response.ok or "html" not in response.headers.get("Content-Type", ""):
+            return ""
+        body = b""
+        for block in response.iter_content(64 * 1024):
+            body += block
+            if len(body) >= PAGE_MAX_BYTES:
+                break
+    
+    text = extract_main_text(body)
+    store.put_page(url, text)
+    return text
+
+SEARCH_URL = os.getenv("ENVIRO_SEARCH_URL", "https://duckduckgo-api.up.railway.app/search")
+
+def search_web(query, session=None, store=None):
+    """Raw search results as dicts with title, link and snippet"""
+    store = store or get_search_store()
+    cached = store.get_search(query)
+    if cached is not None:
+        return cached
+    
+    params = {"q": query, "maxresults": 5}
+    response = (session or get_http_session()).get(SEARCH_URL, params=params, timeout=SEARCH_TIMEOUT)
+    # A rate-limit or error body must not be cached as "no results" for hours
+    response.raise_for_status()
+    data = response.json()
+    results = [
+        {
+            "title": item.get("title", ""),
+            "link": item.get("link", ""),
+            "snippet": item.get("snippet") or item.get("body", ""),
+        }
+        for item in data.get("results", [])
+        if item.get("link")
+    ]
+    if results:
+        store.put_search(query, results)
+    return results
+
+def searchwebquery(query):
+    try:
+        return [f"{item['title']} - {item['link']}" for item in search_web(query)]
+    except Exception as e:
+        return [f"Web search failed: {e}"]
+
+# ------------------------
+# Deep Research
+# ------------------------
+DEEP_RESEARCH_MAX_QUERIES = 5
+DEEP_RESEARCH_TIMEOUT = 12  # seconds for the whole fan-out
+DEEP_RESEARCH_MAX_SOURCES = 12
+SEARCH_WORKERS = 16
+
+@st.cache_resource
+def get_search_executor():
+    """Thread pool shared by all sessions for concurrent web searches"""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="enviro-search")
+
+def decompose_question(question):
+    """Split a question into a handful of search sub-queries"""
+    question = " ".join(question.split())
+    queries = [question]
+    
+    # Separate clauses and comparisons become their own searches
+    for part in re.split(r"[?;]|\bvs\.?\b|\bversus\b|\band\b|\bcompared to\b", question, flags=re.IGNORECASE):
+        part = part.strip(" ,.?")
+        if len(part.split()) >= 2:
+            queries.append(part)
+    
+    # Bias toward data and research sources
+    topic = question.rstrip("?.! ")
+    queries.append(f"{topic} research data")
+    queries.append(f"{topic} site:.gov OR site:.edu")
+    
+    unique = []
+    seen = set()
+    for query in queries:
+        # "What is EnviroCast?" and its clause "What is EnviroCast" are one search
+        key = query.lower().strip(" ,.?")
+        if key not in seen:
+            seen.add(key)
+            unique.append(query)
+    return unique[:DEEP_RESEARCH_MAX_QUERIES]
+
+def source_key(link):
+    """Normalize a URL so the same page found by two queries is kept once"""
+    link = re.sub(r"^https?://(www\.)?", "", link.lower())
+    return link.split("#")[0].rstrip("/")
+
+def run_deep_research(question):
+    """Search all sub-queries concurrently and return deduplicated sources in rank order"""
+    session = get_http_session()
+    store = get_search_store()
+    executor = get_search_executor()
+    futures = [executor.submit(search_web, query, session, store) for query in decompose_question(question)]
+    
+    # Slow or failed searches are dropped rather than holding up the answer
+    done, not_done = concurrent.futures.wait(futures, timeout=DEEP_RESEARCH_TIMEOUT)
+    for future in not_done:
+        future.cancel()
+    
+    sources = []
+    seen = set()
+    # Interleave results so each sub-query contributes its best hits first
+    result_lists = [future.result() for future in futures if future in done and not future.exception()]
+    for rank in range(max((len(results) for results in result_lists), default=0)):
+        for results in result_lists:
+            if rank < len(results):
+                key = source_key(results[rank]["link"])
+                if key not in seen:
+                    seen.add(key)
+                    sources.append(dict(results[rank]))
+    sources = sources[:DEEP_RESEARCH_MAX_SOURCES]
+    
+    fetch_source_pages(sources[:PAGE_FETCH_LIMIT], session, store)
+    return sources
+
+def fetch_source_pages(sources, session, store):
+    """Attach page excerpts to the top sources, fetching concurrently within a deadline"""
+    executor = get_fetch_executor()
+    futures = {executor.submit(fetch_page_text, source["link"], session, store): source for source in sources}
+    
+    done, not_done = concurrent.futures.wait(futures, timeout=PAGE_FETCH_TIMEOUT)
+    for future in not_done:
+        future.cancel()
+    for future in done:
+        if not future.exception() and future.result():
+            futures[future]["content"] = future.result()[:PAGE_EXCERPT_CHARS]
+
+def format_sources(sources):
+    lines = ["WEB SOURCES (Deep Research). Cite these by number and include their URLs in Citations:"]
+    for i, source in enumerate(sources, 1):
+        line = f"[{i}] {source['title']} - {source['link']}"
+        excerpt = source.get("content") or source["snippet"]
+        if excerpt:
+            line += f"\n    {excerpt}"
+        lines.append(line)
+    return "\n".join(lines)
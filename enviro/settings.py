@@ -0,0 +1,167 @@
+"""Sidebar settings and the preference option lists"""
+import streamlit as st
+from enviro import load_json
+from enviro.history import load_conversation
+from enviro.profiler import attach_profile_panel
+from enviro.prompt import update_chat_model
+
+FONT_OPTIONS = load_json("fonts.json")
+LANGUAGE_OPTIONS = load_json("languages.json")
+COLOR_PALETTES = load_json("palettes.json")
+
+# ------------------------
+# Sidebar Settings
+# ------------------------
+def render_sidebar():
+    # Force sidebar to show with expander
+    st.sidebar.markdown("# Settings")
+    
+    with st.sidebar:
+        if st.button("New Conversation", use_container_width=True):
+            load_conversation()
+            st.rerun()
+        
+        # --- Deep Research Section ---
+        st.markdown("## Deep Research")
+    
+        deep_research = st.checkbox(
+            "Enable Deep Research (Web Search)", 
+            st.session_state.get("deep_research", False)
+        )
+        st.session_state.deep_research = deep_research
+
+        st.markdown("### Typography")
+        
+        font_options = FONT_OPTIONS
+        
+        selected_font = st.session_state.get("font_family", "Enviro Sans")
+        if font_options and selected_font not in font_options:
+            selected_font = font_options[0] if font_options else "Enviro Sans"
+        
+        if font_options:
+            newfont = st.selectbox("Font Family", font_options, index=font_options.index(selected_font))
+        else:
+            newfont = st.text_input("Font Family", value=selected_font)
+        
+        new_font_size = st.slider("Font Size", 12, 20, st.session_state.font_size, 1)
+        
+        st.markdown("### Response Settings")
+        
+        length_options = ["Brief", "Standard", "Detailed"]
+        new_response_length = st.selectbox("Response Length", length_options,
+                                         index=length_options.index(st.session_state.response_length))
+        
+        level_options = ["Elementary", "Middle School", "High School", "College"]
+        new_reading_level = st.selectbox("Reading Level", level_options,
+                                       index=level_options.index(st.session_state.reading_level))
+        
+        # Color Palettes
+        st.markdown("### Color Theme")
+        
+        palette_options = list(COLOR_PALETTES.keys()) if COLOR_PALETTES else ["Enviro Cyber"]
+        if st.session_state.color_palette not in palette_options:
+            st.session_state.color_palette = palette_options[0]
+        
+        new_color_palette = st.selectbox("Color Palette", palette_options,
+                                       index=palette_options.index(st.session_state.color_palette))
+        
+        # Display Settings
+        st.markdown("### Display Settings")
+        
+        density_options = ["Compact", "Standard", "Spacious"]
+        new_chat_density = st.selectbox("Chat Density", density_options,
+                                      index=density_options.index(st.session_state.chat_density))
+        
+        speed_options = ["Off", "Slow", "Normal", "Fast"]
+        new_animation_speed = st.selectbox("Animation Speed", speed_options,
+                                         index=speed_options.index(st.session_state.animation_speed))
+        
+        new_show_timestamps = st.checkbox("Show Message Timestamps", st.session_state.show_timestamps)
+        
+        # Content & Context
+        st.markdown("### Content Settings")
+        
+        citation_options = ["MLA", "APA", "None"]
+        new_citation_style = st.selectbox("Citation Style", citation_options,
+                                        index=citation_options.index(st.session_state.citation_style))
+        
+        technical_options = ["Basic", "Intermediate", "Advanced"]
+        new_technical_level = st.selectbox("Technical Detail Level", technical_options,
+                                         index=technical_options.index(st.session_state.technical_level))
+        
+        language_options = LANGUAGE_OPTIONS
+        new_language = st.selectbox("Language", language_options,
+                                  index=language_options.index(st.session_state.language))
+        
+        # Reset button
+        if st.button("Reset to Defaults"):
+            # Reset all preferences to defaults
+            st.session_state.font_family = "Enviro Sans"
+            st.session_state.font_size = 16
+            st.session_state.response_length = "Standard"
+            st.session_state.reading_level = "High School"
+            st.session_state.color_palette = "Enviro Cyber"
+            st.session_state.chat_density = "Standard"
+            st.session_state.animation_speed = "Fast"
+            st.session_state.show_timestamps = False
+            st.session_state.citation_style = "MLA"
+            st.session_state.technical_level = "Intermediate"
+            st.session_state.language = "English"
+            update_chat_model()
+            st.rerun()
+        
+        st.markdown("### Developer")
+        st.checkbox("Profile reruns", key="profile_reruns",
+                    help="Time each rerun by section and list every st.markdown payload it sends")
+        attach_profile_panel()
+
+        st.caption("Powered by Llama 4 Maverick AI")
+        
+        # Check if any preferences changed and update model if needed
+        preferences_changed = (
+            newfont != st.session_state.font_family or
+            new_font_size != st.session_state.font_size or
+            new_response_length != st.session_state.response_length or
+            new_reading_level != st.session_state.reading_level or
+            new_color_palette != st.session_state.color_palette or
+            new_chat_density != st.session_state.chat_density or
+            new_animation_speed != st.session_state.animation_speed or
+            new_show_timestamps != st.session_state.show_timestamps or
+            new_citation_style != st.session_state.citation_style or
+            new_technical_level != st.session_state.technical_level or
+            new_language != st.session_state.language
+        )
+        
+        # Update session state
+        st.session_state.font_family = newfont
+        st.session_state.font_size = new_font_size
+        st.session_state.response_length = new_response_length
+        st.session_state.reading_level = new_reading_level
+        st.session_state.color_palette = new_color_palette
+        st.session_state.chat_density = new_chat_density
+        st.session_state.animation_speed = new_animation_speed
+        st.session_state.show_timestamps = new_show_timestamps
+        st.session_state.citation_style = new_citation_style
+        st.session_state.technical_level = new_technical_level
+        st.session_state.language = new_language
+        
+        # Update model if AI-affecting preferences changed
+        ai_preferences_changed = (
+            new_response_length != st.session_state.get('prev_response_length', '') or
+            new_reading_level != st.session_state.get('prev_reading_level', '') or
+            new_citation_style != st.session_state.get('prev_citation_style', '') or
+            new_technical_level != st.session_state.get('prev_technical_level', '') or
+            new_language != st.session_state.get('prev_language', '')
+        )
+        
+        if ai_preferences_changed:
+            update_chat_model()
+            # Store previous values
+            st.session_state.prev_response_length = new_response_length
+            st.session_state.prev_reading_level = new_reading_level
+            st.session_state.prev_citation_style = new_citation_style
+            st.session_state.prev_technical_level = new_technical_level
+            st.session_state.prev_language = new_language
+        
+        if preferences_changed:
+            st.rerun()
@@ -0,0 +1,93 @@
+"""Theme styles on top of the static stylesheet"""
+import streamlit as st
+import os
+import hashlib
+from enviro import ROOT_DIR
+from enviro.fonts import font_links, material_icons_href, watch_font
+from enviro.settings import COLOR_PALETTES
+
+# -------------------------------------------
+# Dynamic Styles based on preferences
+# -------------------------------------------
+STATIC_STYLESHEET_PATH = os.path.join(ROOT_DIR, "static", "enviro.css")
+
+SYSTEM_FONT_STACK = "system-ui, -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif"
+
+# Default palette if COLOR_PALETTES is empty
+DEFAULT_PALETTE = {
+    "primary": "#00D4FF",
+    "secondary": "#8B5CF6", 
+    "accent": "#10B981",
+    "bg_primary": "#000000",
+    "bg_secondary": "#03060c",
+    "gradient": "linear-gradient(135deg, #00D4FF 0%, #8B5CF6 50%, #10B981 100%)",
+    "message_user": "linear-gradient(135deg, rgba(255, 255, 255, 0.1), rgba(255, 255, 255, 0.05))",
+    "message_assistant": "linear-gradient(135deg, rgba(0, 212, 255, 0.1), rgba(139, 92, 246, 0.05))",
+    "avatar_user": "linear-gradient(135deg, #ffffff, #e0e0e0)",
+    "avatar_assistant": "linear-gradient(135deg, #4CAF50, #2196F3)"
+}
+
+# Chat density settings
+DENSITY_SETTINGS = {
+    "Compact": {"message_margin": "0.75rem", "message_padding": "1rem"},
+    "Standard": {"message_margin": "1.5rem", "message_padding": "1.5rem"},
+    "Spacious": {"message_margin": "2rem", "message_padding": "2rem"}
+}
+
+def get_dynamic_styles():
+    # The static sheet is served once and cached by the browser; only the
+    # small per-theme variables block is compiled (and cached) here
+    styles = build_theme_styles(
+        st.session_state.color_palette,
+        st.session_state.font_family,
+        st.session_state.font_size,
+        st.session_state.chat_density,
+    )
+    styles += f'<link rel="stylesheet" href="{material_icons_href()}">'
+    if st.session_state.font_family == "Enviro Sans":
+        return styles
+    # Self-hosted copy of the font; until it is vendored the fallback stack paints
+    return styles + font_links(st.session_state.font_family, st.session_state.language)
+
+def watch_font_assets():
+    """Rerun once the selected font is vendored, instead of waiting for the next interaction"""
+    if st.session_state.font_family != "Enviro Sans":
+        watch_font(st.session_state.font_family, st.session_state.language)
+
+@st.cache_resource
+def static_stylesheet_href():
+    """Versioned URL of the static stylesheet so browsers cache it until it changes"""
+    with open(STATIC_STYLESHEET_PATH, "rb") as f:
+        version = hashlib.sha1(f.read()).hexdigest()[:12]
+    return f"app/static/enviro.css?v={version}"
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def build_theme_styles(color_palette, font_family, font_size, chat_density):
+    """Compile the per-theme custom property block that drives static/enviro.css"""
+    palette = COLOR_PALETTES.get(color_palette, DEFAULT_PALETTE)
+    density = DENSITY_SETTINGS[chat_density]
+
+    # Handle "Default" font (use Streamlit's default)
+    if font_family == "Enviro Sans":
+        font_stack = SYSTEM_FONT_STACK
+    else:
+        font_stack = f"'{font_family}', {SYSTEM_FONT_STACK}"
+
+    variables = "\n".join(
+        f"    --enviro-{key.replace('_', '-')}: {value};" for key, value in palette.items()
+    )
+
+    return f"""
+<link rel="stylesheet" href="{static_stylesheet_href()}">
+<style>
+:root {{
+{variables}
+    --enviro-primary-border: {palette['primary']}40;
+    --enviro-primary-outline: {palette['primary']}60;
+    --enviro-font-stack: {font_stack};
+    --enviro-font-size: {font_size}px;
+    --enviro-message-margin: {density['message_margin']};
+    --enviro-message-padding: {density['message_padding']};
+}}
+</style>
+"""
@@ -0,0 +1,107 @@
+"""Voice input with chunked background transcription"""
+import streamlit as st
+import os
+import io
+import hashlib
+import concurrent.futures
+
+# ------------------------
+# Voice input
+# ------------------------
+VOICE_BACKEND = os.getenv("ENVIRO_VOICE_BACKEND", "sphinx")  # any offline speech_recognition recognize_<backend>
+VOICE_CHUNK_SECONDS = 15
+VOICE_WORKERS = 4
+VOICE_POLL_SECONDS = 1.0
+
+@st.cache_resource
+def get_transcription_executor():
+    """Background workers shared by all sessions so recognition never blocks a script run"""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=VOICE_WORKERS, thread_name_prefix="enviro-voice")
+
+def split_audio(wav_bytes, seconds=VOICE_CHUNK_SECONDS):
+    """Cut a WAV recording into consecutive AudioData chunks"""
+    import speech_recognition as sr
+    
+    recognizer = sr.Recognizer()
+    chunks = []
+    with sr.AudioFile(io.BytesIO(wav_bytes)) as source:
+        remaining = source.DURATION
+        while remaining > 0:
+            chunks.append(recognizer.record(source, duration=min(seconds, remaining)))
+            remaining -= seconds
+    return chunks
+
+def transcribe_chunk(audio):
+    """Recognize one chunk with the offline backend; silence or noise gives an empty string"""
+    import speech_recognition as sr
+    
+    recognizer = sr.Recognizer()
+    try:
+        return getattr(recognizer, f"recognize_{VOICE_BACKEND}")(audio)
+    except sr.UnknownValueError:
+        return ""
+
+def start_transcription(recording):
+    """Queue a new recording for chunked background transcription"""
+    wav_bytes = recording.getvalue()
+    recording_id = hashlib.sha256(wav_bytes).hexdigest()
+    # The recorder keeps its value across reruns; each recording is queued once
+    if st.session_state.voice_recording_id == recording_id:
+        return
+    st.session_state.voice_recording_id = recording_id
+    
+    executor = get_transcription_executor()
+    st.session_state.voice_job = {
+        "futures": [executor.submit(transcribe_chunk, chunk) for chunk in split_audio(wav_bytes)],
+    }
+
+def voice_transcript_panel():
+    """Show the transcript as chunks finish and let the user send it as a prompt"""
+    job = st.session_state.voice_job
+    finished = [future for future in job["futures"] if future.done()]
+    pending = len(finished) < len(job["futures"])
+    
+    # Transcript so far, in order, up to the first chunk still being recognized
+    parts = []
+    for future in job["futures"]:
+        if not future.done():
+            break
+        if future.exception() is None and future.result():
+            parts.append(future.result())
+    
+    if pending or not job.get("delivered"):
+        st.session_state.voice_transcript = " ".join(parts)
+        job["delivered"] = not pending
+    
+    st.text_area("Transcript", key="voice_transcript", height=100)
+    if pending:
+        st.caption(f"Transcribing... {len(finished)}/{len(job['futures'])} segments")
+    else:
+        errors = [future.exception() for future in job["futures"] if future.exception()]
+        if errors:
+            st.caption(f"⚠️ {len(errors)} segment(s) could not be transcribed: {errors[0]}")
+        if job.get("polling"):
+            # Done: rerun the page once so the panel stops polling
+            job["polling"] = False
+            st.rerun()
+    
+    if st.button("Send transcript", disabled=not st.session_state.voice_transcript.strip()):
+        st.session_state.pending_prompt = st.session_state.voice_transcript.strip()
+        st.session_state.voice_job = None
+        st.rerun()
+
+def render_voice_input():
+    with st.expander("🎙️ Voice input"):
+        recording = st.audio_input("Record a question")
+        if recording is not None:
+            try:
+                start_transcription(recording)
+            except Exception as e:
+                st.error(f"⚠️ Could not read the recording: {str(e)}")
+        
+        job = st.session_state.voice_job
+        if job:
+            pending = not all(future.done() for future in job["futures"])
+            job["polling"] = pending
+            # Only poll while segments are still being recognized
+            st.fragment(voice_transcript_panel, run_every=VOICE_POLL_SECONDS if pending else None)()